@@ -0,0 +1,66 @@
+import glob
+import json
+import os
+import tempfile
+
+# Utilidades de archivos compartidas por las herramientas por lotes; no importa ningún motor
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+DEFAULT_WORKERS = os.cpu_count() or 1
+PARAMETERS_NAME = "parametros.json"
+
+
+def find_images(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = (os.path.join(pattern, name) for name in sorted(os.listdir(pattern)))
+        else:
+            candidates = sorted(glob.glob(pattern, recursive=True))
+        paths.extend(
+            path for path in candidates
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    return list(dict.fromkeys(paths))
+
+
+def output_path_for(input_path, output_dir, output_format):
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f"{name}.{output_format}")
+
+
+# Al día: más reciente que la entrada y, si se indican parámetros, generada con esos mismos parámetros
+def is_up_to_date(input_path, output_path, recorded=None, parameters=None):
+    if not os.path.exists(output_path) or os.path.getmtime(output_path) < os.path.getmtime(input_path):
+        return False
+    return parameters is None or all((recorded or {}).get(name) == value for name, value in parameters.items())
+
+
+# Escribe en un temporal del mismo directorio y lo renombra: quien lee nunca ve un archivo a medias
+def save_atomically(path, save, suffix=None):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1] if suffix is None else suffix, dir=directory)
+    os.close(fd)
+    try:
+        save(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+# Parámetros con que se generó cada salida de un directorio: {nombre de archivo: parámetros}
+def load_parameters(output_dir):
+    try:
+        with open(os.path.join(output_dir, PARAMETERS_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_parameters(output_dir, records):
+    def write(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=1)
+    save_atomically(os.path.join(output_dir, PARAMETERS_NAME), write)
+
@@ -0,0 +1,257 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from archivos import DEFAULT_WORKERS
+from compresion import (
+    compress_array, compress_array_tiled, compression_rate, encode_dct, normalize_image_mode, psnr
+)
+from ondiculas import encode_wavelet
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = [0.3, 1, 3, 12, 50]
+DEFAULT_BLOCK_SIZES = [8, 16, 32]
+
+
+def reference_cv2(image, rate, block_size):
+    import cv2
+    img = np.asarray(image, dtype=np.float32)
+    keep_size = int(block_size * rate)
+    h, w, c = img.shape
+    new_h, new_w = -(-h // block_size) * block_size, -(-w // block_size) * block_size
+    decompressed = np.zeros((new_h, new_w, c), dtype=np.float32)
+    for channel in range(c):
+        padded = np.zeros((new_h, new_w), dtype=np.float32)
+        padded[:h, :w] = img[:, :, channel]
+        for i in range(0, new_h, block_size):
+            for j in range(0, new_w, block_size):
+                dct_block = cv2.dct(padded[i:i + block_size, j:j + block_size])
+                dct_block[keep_size:, :] = 0
+                dct_block[:, keep_size:] = 0
+                decompressed[i:i + block_size, j:j + block_size, channel] = cv2.idct(dct_block)
+    return np.clip(decompressed[:h, :w], 0, 255).astype(np.uint8)
+
+
+def dct_container(color_mode="rgb"):
+    return lambda image, rate, block_size: encode_dct(image, rate, block_size, color_mode=color_mode)
+
+
+def wavelet_container(wavelet):
+    return lambda image, rate, block_size: encode_wavelet(image, rate, block_size, wavelet)
+
+
+# Variantes del motor: función de compresión y codificador del contenedor equivalente
+ENGINES = {
+    "vectorizado": (lambda image, rate, block_size: compress_array(image, rate, block_size), dct_container()),
+    "franjas": (lambda image, rate, block_size: compress_array_tiled(image, rate, block_size), dct_container()),
+    "paralelo": (
+        lambda image, rate, block_size: compress_array_tiled(image, rate, block_size, workers=DEFAULT_WORKERS),
+        dct_container()
+    ),
+    "ycbcr": (
+        lambda image, rate, block_size: compress_array(image, rate, block_size, "ycbcr"),
+        dct_container("ycbcr")
+    ),
+    "haar": (
+        lambda image, rate, block_size: compress_array(image, rate, block_size, engine="haar"),
+        wavelet_container("haar")
+    ),
+    "cdf53": (
+        lambda image, rate, block_size: compress_array(image, rate, block_size, engine="cdf53"),
+        wavelet_container("cdf53")
+    ),
+    "referencia_cv2": (reference_cv2, dct_container()),
+}
+DEFAULT_ENGINES = ["vectorizado", "franjas", "paralelo", "ycbcr", "haar", "cdf53"]
+
+
+def synthetic_image(megapixels, seed=0):
+    width = int(round(np.sqrt(megapixels * 1e6 * 4 / 3)))
+    height = int(round(megapixels * 1e6 / width))
+    rng = np.random.default_rng(seed)
+    y = np.arange(height, dtype=np.float32)[:, None]
+    x = np.arange(width, dtype=np.float32)[None, :]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    for channel in range(3):
+        phase = channel * 0.7
+        plane = 128 + 50 * np.sin(x / 37 + phase) * np.cos(y / 53 - phase) + 40 * (x / width - y / height)
+        plane += rng.normal(0, 6, size=(height, width)).astype(np.float32)
+        # Bordes nítidos: rectángulos de intensidad constante
+        for _ in range(8):
+            y0, x0 = rng.integers(0, height), rng.integers(0, width)
+            plane[y0:y0 + height // 6, x0:x0 + width // 6] = rng.integers(0, 256)
+        image[:, :, channel] = np.clip(plane, 0, 255)
+    return image
+
+
+def sample_image(path, megapixels):
+    with Image.open(path) as img:
+        img = normalize_image_mode(img).convert("RGB")
+        scale = np.sqrt(megapixels * 1e6 / (img.width * img.height))
+        size = (max(1, int(round(img.width * scale))), max(1, int(round(img.height * scale))))
+        return np.asarray(img.resize(size, Image.Resampling.LANCZOS))
+
+
+def load_source(source, megapixels):
+    if source == "sintetica":
+        return synthetic_image(megapixels)
+    return sample_image(source, megapixels)
+
+
+def ssim(original, decompressed):
+    from scipy.ndimage import gaussian_filter
+
+    def luma(image):
+        image = np.asarray(image, dtype=np.float64)
+        return image @ [0.299, 0.587, 0.114] if image.ndim == 3 else image
+
+    x, y = luma(original), luma(decompressed)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_x, mu_y = gaussian_filter(x, 1.5), gaussian_filter(y, 1.5)
+    sigma_x = gaussian_filter(x * x, 1.5) - mu_x ** 2
+    sigma_y = gaussian_filter(y * y, 1.5) - mu_y ** 2
+    sigma_xy = gaussian_filter(x * y, 1.5) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (sigma_x + sigma_y + c2))
+    return float(ssim_map.mean())
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+# Se ejecuta en un proceso nuevo por caso para que el pico de RSS sea propio de ese caso. El pico
+# se informa como crecimiento sobre el de cargar la imagen, que no es parte del motor
+def run_case(source, megapixels, engine, block_size, rate, repeats):
+    image = load_source(source, megapixels)
+    compress, encode = ENGINES[engine]
+    loaded_rss = peak_rss()
+
+    # Tiempos sin tracemalloc, que ralentiza cada asignación
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        decompressed = compress(image, rate, block_size)
+        times.append(time.perf_counter() - start)
+    engine_rss = None if loaded_rss is None else peak_rss() - loaded_rss
+
+    # Pasada aparte para el pico de memoria asignada por Python y NumPy
+    del decompressed
+    tracemalloc.start()
+    decompressed = compress(image, rate, block_size)
+    peak_traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    compressed_bytes = len(encode(image, rate, block_size))
+    seconds = float(np.median(times))
+    actual_megapixels = image.shape[0] * image.shape[1] / 1e6
+    return {
+        "source": os.path.basename(source),
+        "engine": engine,
+        "block_size": block_size,
+        "rate": rate,
+        "width": image.shape[1],
+        "height": image.shape[0],
+        "megapixels": actual_megapixels,
+        "seconds": seconds,
+        "mp_per_s": actual_megapixels / seconds,
+        "loaded_rss_bytes": loaded_rss,
+        "peak_rss_bytes": engine_rss,
+        "peak_traced_bytes": peak_traced,
+        "psnr": psnr(image, decompressed),
+        "ssim": ssim(image, decompressed),
+        "compressed_bytes": compressed_bytes,
+        "compression_ratio": image.nbytes / compressed_bytes,
+    }
+
+
+def case_key(result):
+    return (result["source"], result["engine"], result["block_size"], round(result["megapixels"], 1))
+
+
+# Regresión: más lento que la línea base por encima de la tolerancia o pérdida de calidad
+def find_regressions(results, baseline, speed_tolerance, quality_tolerance):
+    previous = {case_key(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        if result["mp_per_s"] < old["mp_per_s"] * (1 - speed_tolerance):
+            regressions.append(f"{case_key(result)}: {old['mp_per_s']:.2f} -> {result['mp_per_s']:.2f} MP/s")
+        if result["psnr"] < old["psnr"] - quality_tolerance:
+            regressions.append(f"{case_key(result)}: PSNR {old['psnr']:.2f} -> {result['psnr']:.2f} dB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de velocidad y calidad de los motores de compresión")
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES, help="Tamaños en megapíxeles")
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=DEFAULT_BLOCK_SIZES)
+    parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=DEFAULT_ENGINES)
+    parser.add_argument("--images", nargs="*", default=sorted(glob.glob(os.path.join(current_dir, "OI*.jpg"))),
+                        help="Imágenes de muestra; siempre se incluye una imagen sintética")
+    parser.add_argument("-r", "--rate", type=float, default=compression_rate)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("-o", "--output", default="benchmark_compresion.json")
+    parser.add_argument("--baseline", help="Resultados JSON anteriores con los que comparar")
+    parser.add_argument("--speed-tolerance", type=float, default=0.1, help="Pérdida relativa de MP/s admitida")
+    parser.add_argument("--quality-tolerance", type=float, default=0.1, help="Pérdida de PSNR admitida en dB")
+    args = parser.parse_args(argv)
+
+    results = []
+    for source in ["sintetica"] + args.images:
+        for megapixels in args.sizes:
+            for block_size in args.block_sizes:
+                for engine in args.engines:
+                    with ProcessPoolExecutor(max_workers=1) as executor:
+                        result = executor.submit(
+                            run_case, source, megapixels, engine, block_size, args.rate, args.repeats).result()
+                    results.append(result)
+                    rss = result["peak_rss_bytes"]
+                    print(
+                        f"{result['source']:>12} {result['megapixels']:6.2f} MP  b={block_size:<3} "
+                        f"{engine:<15} {result['mp_per_s']:7.2f} MP/s  "
+                        f"RSS +{rss / 2 ** 20 if rss is not None else float('nan'):8.1f} MiB  "
+                        f"PSNR {result['psnr']:6.2f} dB  SSIM {result['ssim']:.4f}  "
+                        f"ratio {result['compression_ratio']:6.1f}:1"
+                    )
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(results, baseline, args.speed_tolerance, args.quality_tolerance)
+        for regression in regressions:
+            print(f"Regresión: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
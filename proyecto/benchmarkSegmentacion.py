@@ -0,0 +1,146 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from segmentador import (
+    BACKBONES, BACKENDS, DEFAULT_MODEL, INFERENCE_MODES, LATENCY_TABLE_PATH, PROFILE_SIZE, configure_threads,
+    load_backend, load_model, measure_latency, predict_mask, prepare_model, profile_backbones, warm_up
+)
+
+# Coincidencia mínima de píxeles entre motores para dar la exportación por válida
+PARITY_THRESHOLD = 0.995
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+# Fracción de píxeles con la misma clase que el modelo de referencia
+def mask_agreement(mask, reference):
+    return float(np.mean(mask == reference))
+
+
+def load_images(paths):
+    return [Image.open(path).convert("RGB") for path in paths]
+
+
+def backbones_command(args):
+    table = profile_backbones(args.models, args.size, args.repeats, args.output)
+
+    images = load_images(args.images)
+    reference = [predict_mask(image, load_model(args.reference)) for image in images]
+
+    print(f"{'modelo':<30} {'s/imagen':>9} {'mIoU':>6} {'GFLOPS':>8} {'coincidencia':>13}")
+    for name in args.models:
+        agreement = [mask_agreement(predict_mask(image, load_model(name)), ref) for image, ref in zip(images, reference)]
+        print(
+            f"{name:<30} {table[name]['seconds']:9.3f} {table[name]['miou']:6.1f} {table[name]['gflops']:8.2f} "
+            f"{np.mean(agreement) if agreement else float('nan'):13.1%}"
+        )
+    print(f"\nTabla guardada en {args.output}; la selección automática la usa.")
+    return 0
+
+
+# Las imágenes que calibran int8 no pueden medir su deriva: sin --calibration-images se calibra
+# con la primera mitad de --images y se mide con el resto
+def split_calibration(paths, calibration_paths=None):
+    if calibration_paths:
+        excluded = set(calibration_paths)
+        return calibration_paths, [path for path in paths if path not in excluded]
+    half = len(paths) // 2
+    return paths[:half], paths[half:]
+
+
+# Latencia de cada modo de inferencia y deriva de sus máscaras respecto al modelo float32. La
+# preparación incluye la primera llamada, donde torch.compile compila
+def modes_command(args):
+    configure_threads(args.threads, args.interop_threads)
+    calibration_paths, drift_paths = split_calibration(args.images, args.calibration_images)
+    calibration = load_images(calibration_paths)
+    images = load_images(drift_paths)
+    baseline_model = prepare_model(args.model, "float32")
+    baseline = [predict_mask(image, baseline_model) for image in images]
+
+    print(f"{'modo':<24} {'preparación s':>14} {'s/imagen':>9} {'aceleración':>12} {'deriva':>8}")
+    baseline_seconds = measure_latency(baseline_model, args.size, args.repeats, inference_mode=False)
+    print(f"{'float32 (no_grad)':<24} {0:14.2f} {baseline_seconds:9.3f} {1:11.2f}x {0:8.2%}")
+    for mode in args.modes:
+        start = time.perf_counter()
+        try:
+            model = prepare_model(args.model, mode, calibration)
+            warm_up(model, args.size)
+            prepare_seconds = time.perf_counter() - start
+            seconds = measure_latency(model, args.size, args.repeats)
+        except Exception as e:
+            print(f"{mode:<24} no disponible: {e}")
+            continue
+        drift = [1 - mask_agreement(predict_mask(image, model), ref) for image, ref in zip(images, baseline)]
+        print(
+            f"{mode:<24} {prepare_seconds:14.2f} {seconds:9.3f} {baseline_seconds / seconds:11.2f}x "
+            f"{np.mean(drift) if drift else float('nan'):8.2%}"
+        )
+    return 0
+
+
+# Carga, latencia y paridad de máscaras de cada motor de inferencia frente a PyTorch
+def backends_command(args):
+    images = load_images(args.images)
+    reference = None
+    failed = False
+    print(f"{'motor':<8} {'carga s':>8} {'s/imagen':>9} {'coincidencia':>13}")
+    for backend in args.backends:
+        start = time.perf_counter()
+        model = load_backend(args.model, backend)
+        load_seconds = time.perf_counter() - start
+        seconds = measure_latency(model, args.size, args.repeats)
+        masks = [predict_mask(image, model) for image in images]
+        if reference is None:
+            reference = masks
+        agreement = np.mean([mask_agreement(mask, ref) for mask, ref in zip(masks, reference)]) if masks else 1.0
+        failed |= agreement < PARITY_THRESHOLD
+        print(f"{backend:<8} {load_seconds:8.2f} {seconds:9.3f} {agreement:13.2%}")
+    if failed:
+        print(f"Paridad por debajo de {PARITY_THRESHOLD:.1%}: revise la exportación ONNX")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latencia y precisión de la segmentación en esta máquina")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    images = argparse.ArgumentParser(add_help=False)
+    images.add_argument("--images", nargs="*", default=sorted(glob.glob(os.path.join(current_dir, "OI*.jpg"))),
+                        help="Imágenes con las que medir la coincidencia de las máscaras")
+    images.add_argument("--size", type=int, default=PROFILE_SIZE, help="Lado de la entrada para medir la latencia")
+    images.add_argument("--repeats", type=int, default=5)
+
+    backbones = subparsers.add_parser("backbones", parents=[images], help="Tabla de latencia y precisión por modelo")
+    backbones.add_argument("--models", nargs="+", choices=list(BACKBONES), default=list(BACKBONES))
+    backbones.add_argument("--reference", choices=list(BACKBONES), default=DEFAULT_MODEL)
+    backbones.add_argument("-o", "--output", default=LATENCY_TABLE_PATH, help="Tabla JSON de latencias")
+    backbones.set_defaults(handler=backbones_command)
+
+    modes = subparsers.add_parser("modes", parents=[images], help="Comparar los modos de inferencia en CPU")
+    modes.add_argument("-m", "--model", choices=list(BACKBONES), default=DEFAULT_MODEL)
+    modes.add_argument("--modes", nargs="+", choices=INFERENCE_MODES, default=list(INFERENCE_MODES))
+    modes.add_argument("--calibration-images", nargs="*",
+                       help="Imágenes para calibrar int8 (por defecto, la primera mitad de --images)")
+    modes.add_argument("--threads", type=int, help="Hilos por operador de PyTorch")
+    modes.add_argument("--interop-threads", type=int, help="Hilos entre operadores de PyTorch")
+    modes.set_defaults(handler=modes_command)
+
+    backends = subparsers.add_parser("backends", parents=[images],
+                                     help="Comparar PyTorch y onnxruntime y comprobar la paridad de las máscaras")
+    backends.add_argument("-m", "--model", choices=list(BACKBONES), default=DEFAULT_MODEL)
+    backends.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS),
+                          help="El primero es la referencia de la paridad")
+    backends.set_defaults(handler=backends_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
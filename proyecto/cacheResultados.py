@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from archivos import save_atomically
+
+RESULT_CACHE_DIR = os.environ.get(
+    "RESULTADOS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "resultados")
+)
+DEFAULT_DISK_BYTES = 512 * 1024 ** 2
+DEFAULT_MEMORY_ENTRIES = 32
+META_ENTRY = "__meta__"
+
+
+# Huella del contenido del archivo: la misma imagen con otro nombre o fecha reutiliza el resultado
+def file_digest(path, chunk_size=1024 ** 2):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# Resultados por clave en disco (.npz comprimido, LRU por fecha de acceso acotado en bytes)
+# con una capa en memoria para las últimas entradas. Los valores son diccionarios: los arrays
+# se guardan comprimidos y el resto como JSON.
+class ResultCache:
+    def __init__(self, namespace, directory=RESULT_CACHE_DIR, max_bytes=DEFAULT_DISK_BYTES,
+                 memory_entries=DEFAULT_MEMORY_ENTRIES):
+        self.directory = os.path.join(directory, namespace)
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    # La capa en memoria guarda y entrega copias: quien recibe un resultado puede modificarlo sin alterar la caché
+    def remember(self, key, value):
+        self.memory[key] = dict(value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    # Un acierto en memoria también actualiza la fecha del archivo: el desalojo en disco sigue el último uso
+    def touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        with self.lock:
+            path = self.path_for(key)
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.touch(path)
+                return dict(self.memory[key])
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    value = json.loads(str(data[META_ENTRY]))
+                    value.update({name: data[name] for name in data.files if name != META_ENTRY})
+            except (OSError, ValueError, KeyError):
+                return None
+            self.touch(path)
+            self.remember(key, value)
+            return value
+
+    def put(self, key, value):
+        arrays = {name: item for name, item in value.items() if isinstance(item, np.ndarray)}
+        meta = {name: item for name, item in value.items() if name not in arrays}
+        with self.lock:
+            self.remember(key, value)
+
+            def write(path):
+                with open(path, "wb") as f:
+                    np.savez_compressed(f, **arrays, **{META_ENTRY: np.array(json.dumps(meta))})
+            # Sufijo .tmp: el desalojo de otro proceso no cuenta ni borra un archivo a medio escribir
+            save_atomically(self.path_for(key), write, suffix=".tmp")
+            self.evict()
+
+    # Borra las entradas usadas hace más tiempo hasta quedar dentro del límite
+    def evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".npz"):
+                    # Otro proceso puede haber borrado la entrada entre el listado y la consulta
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    if name.endswith(".npz"):
+                        os.remove(os.path.join(self.directory, name))
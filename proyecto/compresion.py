@@ -0,0 +1,578 @@
+import hashlib
+import lzma
+import os
+import struct
+import tempfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image
+
+block_size_image = 16
+compression_rate = 0.2
+
+
+# Base ortonormal de la DCT-II (equivalente a cv2.dct por bloque)
+@lru_cache(maxsize=None)
+def dct_matrix(block_size):
+    k = np.arange(block_size)[:, None]
+    n = np.arange(block_size)[None, :]
+    basis = np.cos(np.pi * (2 * n + 1) * k / (2 * block_size)) * np.sqrt(2.0 / block_size)
+    basis[0] /= np.sqrt(2.0)
+    basis = basis.astype(np.float32)
+    basis.flags.writeable = False
+    return basis
+
+
+def keep_size_for(block_size, compression_rate):
+    # Tolerancia para tasas que llegan como k / block_size con error de redondeo (p. ej. desde un slider)
+    return int(block_size * compression_rate + 1e-6)
+
+
+# Proyección sobre los coeficientes conservados: idct(mask * dct(B)) == P @ B @ P
+@lru_cache(maxsize=None)
+def projection_matrix(block_size, compression_rate):
+    basis = dct_matrix(block_size)[:keep_size_for(block_size, compression_rate)]
+    projection = basis.T @ basis
+    projection.flags.writeable = False
+    return projection
+
+
+def pad_to_blocks(img, block_size):
+    h, w = img.shape[:2]
+    new_h = -(-h // block_size) * block_size
+    new_w = -(-w // block_size) * block_size
+    padded_img = np.zeros((new_h, new_w) + img.shape[2:], dtype=np.float32)
+    padded_img[:h, :w] = img
+    return padded_img
+
+
+# (H, W, C) -> (H/b, W/b, C, b, b)
+def to_blocks(padded_img, block_size):
+    new_h, new_w, c = padded_img.shape
+    blocks = padded_img.reshape(new_h // block_size, block_size, new_w // block_size, block_size, c)
+    return blocks.transpose(0, 2, 4, 1, 3)
+
+
+# (H/b, W/b, C, b, b) -> (H, W, C)
+def from_blocks(blocks):
+    rows, cols, c, block_size, _ = blocks.shape
+    return blocks.transpose(0, 3, 1, 4, 2).reshape(rows * block_size, cols * block_size, c)
+
+
+def dct_blocks(blocks):
+    basis = dct_matrix(blocks.shape[-1])
+    return basis @ blocks @ basis.T
+
+
+# Compresión y descompresión fusionadas en una sola pasada sobre todos los bloques y canales
+def dct_compress_decompress(img, compression_rate=compression_rate, block_size=block_size_image):
+    h, w = img.shape[:2]
+    projection = projection_matrix(block_size, compression_rate)
+    blocks = to_blocks(pad_to_blocks(img, block_size), block_size)
+    return from_blocks(projection @ blocks @ projection)[:h, :w]
+
+
+# Espacio de color: en YCbCr la luminancia (y el alfa) se transforma a resolución completa
+# y la crominancia con submuestreo 4:2:0; escala de grises y RGB sin alfa van directos
+COLOR_MODES = {"rgb": 0, "ycbcr": 1}
+RGB_TO_YCBCR = np.array([
+    [0.299, 0.587, 0.114],
+    [-0.168736, -0.331264, 0.5],
+    [0.5, -0.418688, -0.081312]
+], dtype=np.float32)
+YCBCR_TO_RGB = np.linalg.inv(RGB_TO_YCBCR).astype(np.float32)
+
+
+def normalize_image_mode(image_obj):
+    if image_obj.mode in ("L", "RGB", "RGBA"):
+        return image_obj
+    if image_obj.mode in ("LA", "PA") or "transparency" in image_obj.info:
+        return image_obj.convert("RGBA")
+    return image_obj.convert("RGB")
+
+
+def channel_count(img):
+    return 1 if img.ndim == 2 else img.shape[2]
+
+
+def uses_ycbcr(color_mode, channels):
+    if color_mode not in COLOR_MODES:
+        raise ValueError(f"Modo de color no soportado: {color_mode}")
+    return color_mode == "ycbcr" and channels >= 3
+
+
+def subsample_420(plane):
+    h, w, c = plane.shape
+    if h % 2 or w % 2:
+        plane = np.pad(plane, ((0, h % 2), (0, w % 2), (0, 0)), mode="edge")
+    return (plane[0::2, 0::2] + plane[1::2, 0::2] + plane[0::2, 1::2] + plane[1::2, 1::2]) * np.float32(0.25)
+
+
+def upsample_420(plane, shape):
+    h, w = shape
+    half_h, half_w, c = plane.shape
+    upsampled = np.empty((half_h * 2, half_w * 2, c), dtype=plane.dtype)
+    upsampled.reshape(half_h, 2, half_w, 2, c)[:] = plane[:, None, :, None, :]
+    return upsampled[:h, :w]
+
+
+# La conversión es lineal: la crominancia se calcula y se invierte a media resolución
+def color_planes(img, color_mode="rgb"):
+    if img.ndim == 2:
+        img = img[..., None]
+    if not uses_ycbcr(color_mode, img.shape[2]):
+        return [img]
+    rgb = img[..., :3]
+    luma = (rgb @ RGB_TO_YCBCR[0])[..., None]
+    chroma = subsample_420(rgb) @ RGB_TO_YCBCR[1:].T + np.float32(128)
+    full_resolution = np.concatenate([luma, img[..., 3:]], axis=-1) if img.shape[2] > 3 else luma
+    return [full_resolution, chroma]
+
+
+def plane_shapes(original_shape, channels, color_mode="rgb"):
+    h, w = original_shape
+    if not uses_ycbcr(color_mode, channels):
+        return [(h, w, channels)]
+    return [(h, w, channels - 2), ((h + 1) // 2, (w + 1) // 2, 2)]
+
+
+def merge_planes(planes, original_shape, channels, color_mode="rgb"):
+    if not uses_ycbcr(color_mode, channels):
+        return planes[0]
+    full_resolution, chroma = planes
+    chroma_rgb = (chroma - np.float32(128)) @ YCBCR_TO_RGB[:, 1:].T
+    rgb = upsample_420(chroma_rgb, original_shape)
+    rgb += full_resolution[..., :1]
+    return np.concatenate([rgb, full_resolution[..., 1:]], axis=-1) if channels > 3 else rgb
+
+
+def to_uint8(decompressed, shape):
+    return np.clip(decompressed, 0, 255).astype(np.uint8).reshape(shape)
+
+
+# Motores de transformada: DCT por bloques u ondículas por lifting (ver ondiculas.py)
+ENGINES = ("dct", "haar", "cdf53")
+
+
+def plane_transform(engine):
+    if engine == "dct":
+        return dct_compress_decompress
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de compresión no soportado: {engine}")
+    from ondiculas import wavelet_compress_decompress
+    return lambda img, rate, block_size: wavelet_compress_decompress(img, rate, block_size, engine)
+
+
+def compress_array(image, compression_rate=compression_rate, block_size=block_size_image, color_mode="rgb",
+                   engine="dct"):
+    img_array = np.asarray(image, dtype=np.float32)
+    transform = plane_transform(engine)
+    planes = [
+        transform(plane, compression_rate, block_size)
+        for plane in color_planes(img_array, color_mode)
+    ]
+    decompressed = merge_planes(planes, img_array.shape[:2], channel_count(img_array), color_mode)
+    return to_uint8(decompressed, img_array.shape)
+
+
+# Caché LRU de coeficientes DCT completos: cambiar la tasa solo requiere enmascarar e invertir
+COEFFICIENT_CACHE_BYTES = 512 * 1024 * 1024
+_coefficient_cache = OrderedDict()
+
+
+def image_key(image):
+    digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16)
+    digest.update(str(image.shape).encode())
+    return digest.hexdigest()
+
+
+def forward_coefficients(image, block_size=block_size_image):
+    img = color_planes(np.asarray(image, dtype=np.float32))[0]
+    return dct_blocks(to_blocks(pad_to_blocks(img, block_size), block_size)), img.shape[:2]
+
+
+def cached_coefficients(image, block_size=block_size_image, key=None):
+    cache_key = (image_key(image) if key is None else key, block_size)
+    if cache_key in _coefficient_cache:
+        _coefficient_cache.move_to_end(cache_key)
+        return _coefficient_cache[cache_key]
+
+    entry = forward_coefficients(image, block_size)
+    _coefficient_cache[cache_key] = entry
+    cached_bytes = sum(coefficients.nbytes for coefficients, _ in _coefficient_cache.values())
+    while cached_bytes > COEFFICIENT_CACHE_BYTES and len(_coefficient_cache) > 1:
+        evicted, _ = _coefficient_cache.popitem(last=False)[1]
+        cached_bytes -= evicted.nbytes
+    return entry
+
+
+def clear_coefficient_cache():
+    _coefficient_cache.clear()
+
+
+def reconstruct_at_rate(coefficients, original_shape, compression_rate=compression_rate, region=None):
+    block_size = coefficients.shape[-1]
+    h, w = original_shape
+    y0, y1, x0, x1 = region if region is not None else (0, h, 0, w)
+    # Solo se invierten los bloques que cubren la región pedida
+    row0, col0 = y0 // block_size, x0 // block_size
+    row1, col1 = -(-y1 // block_size), -(-x1 // block_size)
+    keep_size = keep_size_for(block_size, compression_rate)
+    selected = coefficients[row0:row1, col0:col1, :, :keep_size, :keep_size]
+    offset_y, offset_x = y0 - row0 * block_size, x0 - col0 * block_size
+    decompressed = reconstruct_from_low_frequency(
+        selected, (offset_y + y1 - y0, offset_x + x1 - x0), block_size)[offset_y:, offset_x:]
+    return to_uint8(decompressed, decompressed.shape[:2] if decompressed.shape[2] == 1 else decompressed.shape)
+
+
+# Procesamiento por franjas de bloques con memoria acotada para imágenes muy grandes
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+WORKING_COPIES = 6
+
+
+def rows_per_strip(width, channels, block_size=block_size_image, memory_budget=DEFAULT_MEMORY_BUDGET):
+    padded_w = -(-width // block_size) * block_size
+    block_row_bytes = block_size * padded_w * channels * np.dtype(np.float32).itemsize * WORKING_COPIES
+    block_rows = memory_budget // block_row_bytes
+    if block_rows < 1:
+        raise ValueError(
+            f"El presupuesto de memoria ({memory_budget} bytes) no alcanza para una fila de bloques "
+            f"({block_row_bytes} bytes)"
+        )
+    return block_rows * block_size
+
+
+# Las ondículas eligen los coeficientes conservados sobre el plano entero: se transforma cada canal
+# completo (uno por trabajador), de modo que la salida no depende de franjas ni de trabajadores.
+# El presupuesto de memoria no se aplica a este camino.
+def compress_array_channels(image, compression_rate=compression_rate, block_size=block_size_image, out=None,
+                            workers=1, color_mode="rgb", engine="cdf53"):
+    img_array = np.asarray(image, dtype=np.float32)
+    transform = plane_transform(engine)
+    planes = color_planes(img_array, color_mode)
+    tasks = [(plane, channel) for plane in planes for channel in range(plane.shape[2])]
+
+    def compress_channel(task):
+        plane, channel = task
+        return transform(plane[..., channel:channel + 1], compression_rate, block_size)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        channels = iter(executor.map(compress_channel, tasks))
+        planes = [np.concatenate([next(channels) for _ in range(plane.shape[2])], axis=-1) for plane in planes]
+    decompressed = merge_planes(planes, img_array.shape[:2], channel_count(img_array), color_mode)
+    if out is None:
+        return to_uint8(decompressed, img_array.shape)
+    out[...] = to_uint8(decompressed, img_array.shape)
+    return out
+
+
+def compress_array_tiled(image, compression_rate=compression_rate, block_size=block_size_image,
+                         memory_budget=DEFAULT_MEMORY_BUDGET, out=None, workers=1, color_mode="rgb",
+                         engine="dct"):
+    if engine != "dct":
+        return compress_array_channels(image, compression_rate, block_size, out, workers, color_mode, engine)
+    h, w = image.shape[:2]
+    c = channel_count(image)
+    if out is None:
+        out = np.empty(image.shape, dtype=np.uint8)
+    # Con croma 4:2:0 las franjas deben alinearse a bloques de la crominancia submuestreada
+    strip_align = block_size
+    if uses_ycbcr(color_mode, c):
+        strip_align *= 2
+    if workers <= 1:
+        strip_height = rows_per_strip(w, c, strip_align, memory_budget) // strip_align * strip_align
+        for y in range(0, h, strip_height):
+            out[y:y + strip_height] = compress_array(
+                image[y:y + strip_height], compression_rate, block_size, color_mode, engine)
+        return out
+
+    # Cada trabajador procesa una franja (de un solo canal en RGB); con la DCT los bloques son
+    # independientes, así que el resultado es idéntico al de la ruta secuencial
+    per_channel = image.ndim == 3 and not uses_ycbcr(color_mode, c)
+    strip_height = min(
+        rows_per_strip(w, 1 if per_channel else c, strip_align, memory_budget // workers),
+        -(-h // (workers * strip_align)) * strip_align
+    )
+
+    def compress_strip(task):
+        y, channel = task
+        if channel is None:
+            out[y:y + strip_height] = compress_array(
+                image[y:y + strip_height], compression_rate, block_size, color_mode, engine)
+            return
+        strip = image[y:y + strip_height, :, channel:channel + 1]
+        out[y:y + strip_height, :, channel] = compress_array(
+            strip, compression_rate, block_size, engine=engine)[..., 0]
+
+    channels = range(c) if per_channel else [None]
+    tasks = [(y, channel) for y in range(0, h, strip_height) for channel in channels]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(compress_strip, tasks))
+    return out
+
+
+# Las imágenes muy grandes superan el límite de PIL contra bombas de descompresión; aquí se aceptan
+def load_image_unbounded(input_path):
+    max_pixels = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        with Image.open(input_path) as img:
+            return np.asarray(normalize_image_mode(img))
+    finally:
+        Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+# Parámetros de codificación iguales a los que usaba PIL por defecto
+IMWRITE_PARAMS = {".jpg": [cv2.IMWRITE_JPEG_QUALITY, 75], ".jpeg": [cv2.IMWRITE_JPEG_QUALITY, 75],
+                  ".png": [cv2.IMWRITE_PNG_COMPRESSION, 6]}
+
+
+# La salida intermedia vive en disco y el codificador de OpenCV la lee directamente desde el mapa,
+# sin copiarla entera a memoria; solo la franja en curso ocupa memoria de trabajo. El formato sale
+# de la extensión de output_path
+def save_compressed_tiled(image, output_path, compression_rate=compression_rate, block_size=block_size_image,
+                          memory_budget=DEFAULT_MEMORY_BUDGET, scratch_dir=None, workers=1, color_mode="rgb",
+                          engine="dct"):
+    extension = os.path.splitext(output_path)[1].lower()
+    # JPEG no admite canal alfa
+    if extension in (".jpg", ".jpeg") and image.ndim == 3 and image.shape[2] == 4:
+        image = image[..., :3]
+    fd, scratch_path = tempfile.mkstemp(suffix=".raw", dir=scratch_dir)
+    os.close(fd)
+    try:
+        out = np.memmap(scratch_path, dtype=np.uint8, mode="w+", shape=image.shape)
+        compress_array_tiled(image, compression_rate, block_size, memory_budget, out, workers, color_mode, engine)
+        # OpenCV espera BGR(A): se intercambian los canales franja a franja sobre el propio mapa
+        if out.ndim == 3 and out.shape[2] >= 3:
+            swap = [2, 1, 0, 3][:out.shape[2]]
+            rows = rows_per_strip(out.shape[1], out.shape[2], block_size, memory_budget)
+            for y in range(0, out.shape[0], rows):
+                out[y:y + rows] = out[y:y + rows, :, swap]
+        out.flush()
+        if not cv2.imwrite(output_path, out, IMWRITE_PARAMS.get(extension, [])):
+            raise ValueError(f"No se pudo guardar la imagen: {output_path}")
+        del out
+    finally:
+        os.remove(scratch_path)
+
+
+# Región centrada que la vista previa muestra a escala 1:1, sin reescalar
+def preview_region(original_shape, size=400):
+    h, w = original_shape[:2]
+    region_h, region_w = min(size, h), min(size, w)
+    y0, x0 = (h - region_h) // 2, (w - region_w) // 2
+    return y0, y0 + region_h, x0, x0 + region_w
+
+
+# Coeficientes de los bloques que cubren la región, con los mismos bordes que en la imagen completa:
+# la memoria depende del tamaño de la región y no del de la imagen.
+# -> (coeficientes, forma del recorte, región relativa al recorte) para reconstruct_at_rate
+def preview_coefficients(image, region, block_size=block_size_image, key=None):
+    h, w = image.shape[:2]
+    y0, y1, x0, x1 = region
+    top, left = y0 // block_size * block_size, x0 // block_size * block_size
+    bottom, right = min(h, -(-y1 // block_size) * block_size), min(w, -(-x1 // block_size) * block_size)
+    coefficients, crop_shape = cached_coefficients(
+        image[top:bottom, left:right], block_size, None if key is None else (key, region))
+    return coefficients, crop_shape, (y0 - top, y1 - top, x0 - left, x1 - left)
+
+
+# Formato de archivo comprimido: cabecera y, por cada plano de color, pasos de cuantización
+# + coeficientes de baja frecuencia de cada bloque, en zig-zag y agrupados por posición.
+FORMAT_MAGIC = b"DCT1"
+HEADER_FORMAT = "<4sIIBBBBBB"
+QUANTIZATION_TYPES = {"int8": (1, np.int8), "int16": (2, np.int16)}
+ENTROPY_CODECS = {"zlib": 1, "lzma": 2}
+
+
+@lru_cache(maxsize=None)
+def zigzag_order(size):
+    positions = sorted(
+        ((i, j) for i in range(size) for j in range(size)),
+        key=lambda p: (p[0] + p[1], p[0] if (p[0] + p[1]) % 2 else p[1])
+    )
+    order = np.array([i * size + j for i, j in positions], dtype=np.intp)
+    order.flags.writeable = False
+    return order
+
+
+def low_frequency_coefficients(img, keep_size, block_size=block_size_image):
+    basis = dct_matrix(block_size)[:keep_size]
+    blocks = to_blocks(pad_to_blocks(img, block_size), block_size)
+    return basis @ blocks @ basis.T
+
+
+def reconstruct_from_low_frequency(coefficients, original_shape, block_size=block_size_image):
+    h, w = original_shape
+    basis = dct_matrix(block_size)[:coefficients.shape[-1]]
+    return from_blocks(basis.T @ coefficients @ basis)[:h, :w]
+
+
+def entropy_encode(payload, codec):
+    if codec == "zlib":
+        return zlib.compress(payload, 9)
+    return lzma.compress(payload, preset=6)
+
+
+def entropy_decode(payload, codec):
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    return lzma.decompress(payload)
+
+
+def encode_dct(image, compression_rate=compression_rate, block_size=block_size_image,
+               quantization="int8", codec="zlib", color_mode="rgb"):
+    img = np.asarray(image, dtype=np.float32)
+    keep_size = keep_size_for(block_size, compression_rate)
+    planes = [
+        low_frequency_coefficients(plane, keep_size, block_size)
+        for plane in color_planes(img, color_mode)
+    ]
+    return encode_coefficients(planes, img.shape[:2], channel_count(img), block_size, quantization, codec,
+                               color_mode)
+
+
+def encode_plane(coefficients, dtype, codec):
+    keep_size = coefficients.shape[-1]
+    zigzag = coefficients.reshape(-1, keep_size * keep_size)[:, zigzag_order(keep_size)].T
+
+    max_values = np.abs(zigzag).max(axis=1)
+    steps = np.where(max_values > 0, max_values / np.iinfo(dtype).max, 1).astype(np.float32)
+    quantized = np.rint(zigzag / steps[:, None]).astype(dtype)
+
+    payload = entropy_encode(quantized.tobytes(), codec)
+    return steps.tobytes() + struct.pack("<I", len(payload)) + payload
+
+
+def encode_coefficients(planes, original_shape, channels, block_size=block_size_image,
+                        quantization="int8", codec="zlib", color_mode="rgb"):
+    if quantization not in QUANTIZATION_TYPES:
+        raise ValueError(f"Cuantización no soportada: {quantization}")
+    if codec not in ENTROPY_CODECS:
+        raise ValueError(f"Codificador no soportado: {codec}")
+    keep_size = planes[0].shape[-1]
+    if keep_size < 1:
+        raise ValueError("La tasa de compresión no conserva ningún coeficiente")
+
+    h, w = original_shape
+    dtype_code, dtype = QUANTIZATION_TYPES[quantization]
+    stored_mode = "ycbcr" if uses_ycbcr(color_mode, channels) else "rgb"
+    header = struct.pack(HEADER_FORMAT, FORMAT_MAGIC, h, w, channels, block_size, keep_size,
+                         dtype_code, ENTROPY_CODECS[codec], COLOR_MODES[stored_mode])
+    return header + b"".join(encode_plane(coefficients, dtype, codec) for coefficients in planes)
+
+
+def decode_plane(data, offset, plane_shape, block_size, keep_size, dtype, codec):
+    coefficient_count = keep_size * keep_size
+    steps = np.frombuffer(data, dtype=np.float32, count=coefficient_count, offset=offset)
+    offset += coefficient_count * 4
+    (payload_size,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    quantized = np.frombuffer(entropy_decode(data[offset:offset + payload_size], codec), dtype=dtype)
+    offset += payload_size
+
+    zigzag = quantized.reshape(coefficient_count, -1).astype(np.float32) * steps[:, None]
+    coefficients = np.empty_like(zigzag.T)
+    coefficients[:, zigzag_order(keep_size)] = zigzag.T
+    h, w, c = plane_shape
+    rows, cols = -(-h // block_size), -(-w // block_size)
+    coefficients = coefficients.reshape(rows, cols, c, keep_size, keep_size)
+    return reconstruct_from_low_frequency(coefficients, (h, w), block_size), offset
+
+
+def decode_dct(data):
+    header_size = struct.calcsize(HEADER_FORMAT)
+    magic, h, w, c, block_size, keep_size, dtype_code, codec_code, color_code = struct.unpack(
+        HEADER_FORMAT, data[:header_size])
+    if magic != FORMAT_MAGIC:
+        raise ValueError("El archivo no es una imagen comprimida con DCT")
+
+    dtype = next(t for code, t in QUANTIZATION_TYPES.values() if code == dtype_code)
+    codec = next(name for name, code in ENTROPY_CODECS.items() if code == codec_code)
+    color_mode = next(name for name, code in COLOR_MODES.items() if code == color_code)
+
+    planes = []
+    offset = header_size
+    for plane_shape in plane_shapes((h, w), c, color_mode):
+        plane, offset = decode_plane(data, offset, plane_shape, block_size, keep_size, dtype, codec)
+        planes.append(plane)
+
+    decompressed = merge_planes(planes, (h, w), c, color_mode)
+    return to_uint8(decompressed, (h, w) if c == 1 else (h, w, c))
+
+
+def compression_report(image, data):
+    original_bytes = np.asarray(image).nbytes
+    compressed_bytes = len(data)
+    return {
+        "original_bytes": original_bytes,
+        "compressed_bytes": compressed_bytes,
+        "compression_ratio": original_bytes / compressed_bytes,
+        "space_saving": 1 - compressed_bytes / original_bytes,
+    }
+
+
+# Control de tasa: elegir el nivel de retención para un PSNR o un tamaño objetivo
+# reutilizando los coeficientes ya calculados
+def psnr(original, decompressed):
+    mse = np.mean((np.asarray(original, dtype=np.float64) - np.asarray(decompressed, dtype=np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+# Por Parseval, el error cuadrático es la energía de los coeficientes descartados
+def predicted_psnr(coefficients):
+    block_size = coefficients.shape[-1]
+    energy = np.einsum("abcij,abcij->ij", coefficients, coefficients, dtype=np.float64)
+    kept = np.array([energy[:k, :k].sum() for k in range(block_size + 1)])
+    mse = (energy.sum() - kept) / coefficients.size
+    with np.errstate(divide="ignore"):
+        return np.where(mse > 0, 10 * np.log10(255.0 ** 2 / np.maximum(mse, 1e-12)), np.inf)
+
+
+def rate_for_target_psnr(coefficients, original_shape, target_psnr, image=None):
+    block_size = coefficients.shape[-1]
+    predicted = predicted_psnr(coefficients)
+    keep_size = next((k for k in range(1, block_size + 1) if predicted[k] >= target_psnr), block_size)
+    if image is None:
+        return keep_size / block_size
+
+    # La predicción ignora el recorte a [0, 255] y cuenta el relleno de los bloques del borde, así
+    # que puede errar en ambos sentidos: búsqueda binaria con pasadas inversas reales, empezando
+    # por el nivel predicho
+    def reaches_target(keep_size):
+        return psnr(image, reconstruct_at_rate(coefficients, original_shape, keep_size / block_size)) >= target_psnr
+
+    if reaches_target(keep_size):
+        low, high = 1, keep_size
+    else:
+        low, high = keep_size + 1, block_size
+    while low < high:
+        middle = (low + high) // 2
+        if reaches_target(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return min(low, block_size) / block_size
+
+
+def rate_for_target_size(coefficients, original_shape, target_bytes, quantization="int8", codec="zlib"):
+    block_size = coefficients.shape[-1]
+    best = None
+    low, high = 1, block_size
+    while low <= high:
+        keep_size = (low + high) // 2
+        data = encode_coefficients([coefficients[..., :keep_size, :keep_size]], original_shape,
+                                   coefficients.shape[2], block_size, quantization, codec)
+        if len(data) <= target_bytes:
+            best = (keep_size / block_size, data)
+            low = keep_size + 1
+        else:
+            high = keep_size - 1
+    if best is None:
+        raise ValueError(f"Ningún nivel de compresión cabe en {target_bytes} bytes")
+    return best
@@ -2,8 +2,15 @@ from PIL import Image, ImageTk
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import numpy as np
+import os
 import sys
 
+from archivos import DEFAULT_WORKERS
+from compresion import (
+    block_size_image, compression_rate, compress_array_tiled, compression_report, encode_dct,
+    normalize_image_mode, preview_coefficients, preview_region, reconstruct_at_rate, save_compressed_tiled
+)
+
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 
@@ -32,79 +39,16 @@ def check_dependencies():
             return False
     return True
 
-block_size_image = 16
-compression_rate = 0.2
-
 
 def compress_image_to_80(image_obj):
     if not isinstance(image_obj, Image.Image):
         raise TypeError("El parámetro debe ser un objeto de tipo PIL.Image.Image")
     
     try:
-        import cv2
-        image = np.array(image_obj)
-        
-        def dct_compress_blocks(img, compression_rate):
-            h, w = img.shape
-
-            new_h = h + (block_size_image - h % block_size_image) if h % block_size_image != 0 else h
-            new_w = w + (block_size_image - w % block_size_image) if w % block_size_image != 0 else w
-            padded_img = np.zeros((new_h, new_w), dtype=np.float32)
-            padded_img[:h, :w] = img
-
-            compressed_img = np.zeros((new_h, new_w), dtype=np.float32)
-
-            for i in range(0, new_h, block_size_image):
-                for j in range(0, new_w, block_size_image):
-                    block = padded_img[i:i+block_size_image, j:j+block_size_image]
-                    dct_block = cv2.dct(block)
-                    mask = np.zeros((block_size_image, block_size_image), dtype=np.float32)
-                    keep_size = int(block_size_image * compression_rate)
-                    mask[:keep_size, :keep_size] = 1
-                    dct_block *= mask
-                    compressed_img[i:i+block_size_image, j:j+block_size_image] = dct_block
-
-            return compressed_img, (h, w)
-
-        def dct_decompress_blocks(compressed_img, original_shape):
-            new_h, new_w = compressed_img.shape
-            decompressed_img = np.zeros((new_h, new_w), dtype=np.float32)
-
-            for i in range(0, new_h, block_size_image):
-                for j in range(0, new_w, block_size_image):
-                    dct_block = compressed_img[i:i+block_size_image, j:j+block_size_image]
-                    block = cv2.idct(dct_block)
-                    decompressed_img[i:i+block_size_image, j:j+block_size_image] = block
-
-            h, w = original_shape
-            return decompressed_img[:h, :w]
-
-        def dct_compress_rgb(img, compression_rate):
-            h, w, c = img.shape
-            compressed_img = []
-            shapes = []
-
-            for channel in range(c):
-                compressed_channel, shape = dct_compress_blocks(img[:, :, channel], compression_rate)
-                compressed_img.append(compressed_channel)
-                shapes.append(shape)
-
-            return np.stack(compressed_img, axis=-1), shapes
-
-        def dct_decompress_rgb(compressed_img, shapes):
-            c = compressed_img.shape[-1]
-            decompressed_img = []
-
-            for channel in range(c):
-                decompressed_channel = dct_decompress_blocks(compressed_img[:, :, channel], shapes[channel])
-                decompressed_img.append(decompressed_channel)
-
-            return np.stack(decompressed_img, axis=-1)
-
-        img_array = image.astype(np.float32)
-
-        compressed_image, shapes = dct_compress_rgb(img_array, compression_rate)
-        decompressed_image = np.clip(dct_decompress_rgb(compressed_image, shapes), 0, 255).astype(np.uint8)
+        image = np.array(normalize_image_mode(image_obj))
+        decompressed_image = compress_array_tiled(
+            image, compression_rate, block_size_image, workers=DEFAULT_WORKERS
+        )
 
         return Image.fromarray(decompressed_image)
     except Exception as e:
@@ -118,49 +62,117 @@ def select_and_compress_image():
         return
     
     try:
-        original_image = Image.open(file_path)
+        original_image = normalize_image_mode(Image.open(file_path))
+        image_array = np.array(original_image)
         
         compressed_image = compress_image_to_80(original_image)
         
-        display_images(original_image, compressed_image)
+        # La vista previa muestra una región a escala 1:1; sus coeficientes se calculan una sola vez y
+        # cambiar la tasa solo reconstruye esa región
+        region = preview_region(image_array.shape)
+        preview = preview_coefficients(
+            image_array, region, block_size_image, key=(file_path, os.path.getmtime(file_path))
+        )
         
-        save_path = filedialog.asksaveasfilename(defaultextension=".jpg", filetypes=[("JPEG files", "*.jpg")])
-        if save_path:
-            compressed_image.save(save_path, "JPEG")
-            messagebox.showinfo("Éxito", "Imagen comprimida guardada correctamente.")
+        display_images(original_image, compressed_image, image_array, region, preview)
     except Exception as e:
         messagebox.showerror("Error", f"Error al procesar la imagen: {e}")
 
 
-def display_images(original, compressed):
+def save_compressed_image(image_array, rate):
+    save_path = filedialog.asksaveasfilename(
+        defaultextension=".jpg",
+        filetypes=[("JPEG files", "*.jpg"), ("DCT comprimido", "*.dct")]
+    )
+    if not save_path:
+        return
+
+    try:
+        if save_path.lower().endswith(".dct"):
+            data = encode_dct(image_array, rate, block_size_image)
+            with open(save_path, "wb") as f:
+                f.write(data)
+            report = compression_report(image_array, data)
+            messagebox.showinfo(
+                "Éxito",
+                f"Imagen comprimida guardada correctamente.\n\n"
+                f"Tamaño original: {report['original_bytes']} bytes\n"
+                f"Tamaño comprimido: {report['compressed_bytes']} bytes\n"
+                f"Relación de compresión: {report['compression_ratio']:.1f}:1 "
+                f"({report['space_saving']:.1%} de ahorro)"
+            )
+        else:
+            save_compressed_tiled(image_array, save_path, rate, block_size_image, workers=DEFAULT_WORKERS)
+            messagebox.showinfo("Éxito", "Imagen comprimida guardada correctamente.")
+    except Exception as e:
+        messagebox.showerror("Error", f"Error al guardar la imagen: {e}")
+
+
+def display_images(original, compressed, image_array, region, preview):
     display_window = ctk.CTkToplevel()
     display_window.title("Comparación de Imágenes")
-    display_window.geometry("900x500")
-    
-    max_size = (400, 400)
-    original_resized = original.copy()
-    original_resized.thumbnail(max_size)
-    compressed_resized = compressed.copy()
-    compressed_resized.thumbnail(max_size)
+    display_window.geometry("900x620")
     
-    original_tk = ImageTk.PhotoImage(original_resized)
-    compressed_tk = ImageTk.PhotoImage(compressed_resized)
+    # Ambas imágenes muestran la misma región a escala 1:1 para compararlas sin reescalado
+    y0, y1, x0, x1 = region
+    original_tk = ImageTk.PhotoImage(original.crop((x0, y0, x1, y1)))
+    compressed_tk = ImageTk.PhotoImage(compressed.crop((x0, y0, x1, y1)))
     
     frame = ctk.CTkFrame(display_window, corner_radius=15)
     frame.pack(padx=20, pady=20, fill="both", expand=True)
     
     original_frame = ctk.CTkFrame(frame, corner_radius=10)
     original_frame.pack(side="left", padx=20, pady=20, fill="both", expand=True)
-    ctk.CTkLabel(original_frame, text="Imagen Original", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=10)
+    ctk.CTkLabel(original_frame, text="Imagen Original (detalle 1:1)", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=10)
     original_label = ctk.CTkLabel(original_frame, image=original_tk, text="")
     original_label.pack(pady=10)
     
     compressed_frame = ctk.CTkFrame(frame, corner_radius=10)
     compressed_frame.pack(side="right", padx=20, pady=20, fill="both", expand=True)
-    ctk.CTkLabel(compressed_frame, text="Imagen Comprimida (80%)", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=10)
+    ctk.CTkLabel(compressed_frame, text="Imagen Comprimida (detalle 1:1)", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=10)
     compressed_label = ctk.CTkLabel(compressed_frame, image=compressed_tk, text="")
     compressed_label.pack(pady=10)
     
+    controls_frame = ctk.CTkFrame(display_window, corner_radius=15)
+    controls_frame.pack(padx=20, pady=(0, 20), fill="x")
+    
+    rate_label = ctk.CTkLabel(
+        controls_frame,
+        text=f"Tasa de compresión: {compression_rate:.2f}",
+        font=ctk.CTkFont(size=14)
+    )
+    rate_label.pack(pady=(10, 0))
+    
+    # La región se reconstruye a resolución completa desde los coeficientes en caché
+    coefficients, crop_shape, crop_region = preview
+    def update_preview(rate):
+        preview_tk = ImageTk.PhotoImage(
+            Image.fromarray(reconstruct_at_rate(coefficients, crop_shape, rate, region=crop_region))
+        )
+        compressed_label.configure(image=preview_tk)
+        display_window.compressed_tk = preview_tk
+        rate_label.configure(text=f"Tasa de compresión: {rate:.2f}")
+    
+    rate_slider = ctk.CTkSlider(
+        controls_frame,
+        from_=1 / block_size_image,
+        to=1,
+        number_of_steps=block_size_image - 1,
+        command=update_preview
+    )
+    rate_slider.set(compression_rate)
+    rate_slider.pack(padx=20, pady=10, fill="x")
+    
+    ctk.CTkButton(
+        controls_frame,
+        text="Guardar Imagen",
+        command=lambda: save_compressed_image(image_array, rate_slider.get()),
+        font=ctk.CTkFont(size=14, weight="bold"),
+        corner_radius=10,
+        fg_color="#2ECC71",
+        hover_color="#27AE60"
+    ).pack(pady=(0, 10))
+    
     display_window.original_tk = original_tk
     display_window.compressed_tk = compressed_tk
 
@@ -0,0 +1,202 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from archivos import DEFAULT_WORKERS, find_images, is_up_to_date, load_parameters, output_path_for, save_parameters
+from compresion import (
+    COLOR_MODES, DEFAULT_MEMORY_BUDGET, ENGINES, block_size_image, compression_rate, decode_dct, encode_dct,
+    forward_coefficients, load_image_unbounded, psnr, rate_for_target_psnr, rate_for_target_size, save_compressed_tiled
+)
+from ondiculas import encode_wavelet
+
+OUTPUT_FORMATS = ("dct", "dwt", "jpg", "png")
+
+
+def write_output(image, output_path, output_format, rate, block_size, memory_budget, color_mode, engine, data=None):
+    if output_format in ("dct", "dwt"):
+        if data is None and output_format == "dct":
+            data = encode_dct(image, rate, block_size, color_mode=color_mode)
+        elif data is None:
+            data = encode_wavelet(image, rate, block_size, engine, color_mode=color_mode)
+        with open(output_path, "wb") as f:
+            f.write(data)
+    else:
+        save_compressed_tiled(image, output_path, rate, block_size, memory_budget, color_mode=color_mode,
+                              engine=engine)
+
+
+# PSNR del archivo ya codificado, tal como lo leerá quien lo abra
+def output_psnr(image, output_path, output_format):
+    if output_format == "dct":
+        with open(output_path, "rb") as f:
+            decoded = decode_dct(f.read())
+    else:
+        decoded = load_image_unbounded(output_path)
+    # JPEG descarta el canal alfa
+    if decoded.ndim == 3 and decoded.shape[2] < image.shape[2]:
+        image = image[..., :decoded.shape[2]]
+    return psnr(image, decoded)
+
+
+# Decodifica, transforma y codifica un archivo; se ejecuta en un proceso trabajador
+def compress_file(input_path, output_path, output_format, rate, block_size, memory_budget,
+                  target_psnr=None, target_size=None, color_mode="rgb", engine="dct"):
+    start = time.perf_counter()
+    image = load_image_unbounded(input_path)
+
+    data = None
+    if target_psnr is not None or target_size is not None:
+        coefficients, original_shape = forward_coefficients(image, block_size)
+        if target_size is not None:
+            rate, data = rate_for_target_size(coefficients, original_shape, target_size)
+        else:
+            rate = rate_for_target_psnr(coefficients, original_shape, target_psnr, image)
+        del coefficients
+
+    write_output(image, output_path, output_format, rate, block_size, memory_budget, color_mode, engine, data)
+    measured_psnr = None
+    if target_psnr is not None:
+        # La tasa se eligió sobre la reconstrucción sin cuantizar; la cuantización del contenedor o
+        # del codificador JPEG puede dejar el archivo por debajo del objetivo, así que se sube la
+        # tasa hasta que la salida real lo alcance
+        keep_size = round(rate * block_size)
+        measured_psnr = output_psnr(image, output_path, output_format)
+        while measured_psnr < target_psnr and keep_size < block_size:
+            keep_size += 1
+            rate = keep_size / block_size
+            write_output(image, output_path, output_format, rate, block_size, memory_budget, color_mode, engine)
+            measured_psnr = output_psnr(image, output_path, output_format)
+
+    return {
+        "input": input_path,
+        "output": output_path,
+        "rate": rate,
+        "psnr": measured_psnr,
+        "megapixels": image.shape[0] * image.shape[1] / 1e6,
+        "seconds": time.perf_counter() - start,
+        "input_bytes": os.path.getsize(input_path),
+        "output_bytes": os.path.getsize(output_path),
+    }
+
+
+def print_result(result):
+    print(
+        f"{result['input']} -> {result['output']}: {result['megapixels']:.2f} MP en "
+        f"{result['seconds']:.2f} s ({result['megapixels'] / result['seconds']:.2f} MP/s), "
+        f"{result['input_bytes']} -> {result['output_bytes']} bytes (tasa {result['rate']:.4g}"
+        + ("" if result["psnr"] is None else f", PSNR {result['psnr']:.2f} dB") + ")"
+    )
+
+
+def compress_command(args):
+    if args.target_size is not None and args.format != "dct":
+        print("--target-size solo se admite con --format dct.", file=sys.stderr)
+        return 2
+    if (args.target_psnr is not None or args.target_size is not None) and (
+            args.color != "rgb" or args.engine != "dct"):
+        print("--target-psnr y --target-size solo se admiten con --color rgb y --engine dct.", file=sys.stderr)
+        return 2
+    if (args.format == "dct" and args.engine != "dct") or (args.format == "dwt" and args.engine == "dct"):
+        print("--format dct requiere --engine dct y --format dwt un motor de ondículas.", file=sys.stderr)
+        return 2
+    # Las ondículas transforman cada canal entero: no hay franjas con las que acotar la memoria
+    if args.memory_budget is not None and args.engine != "dct":
+        print("--memory-budget solo se admite con --engine dct.", file=sys.stderr)
+        return 2
+    paths = find_images(args.inputs)
+    if not paths:
+        print("No se encontraron imágenes para comprimir.")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    # Cambiar cualquiera de estos parámetros invalida las salidas ya generadas
+    parameters = {
+        "format": args.format, "rate": args.rate, "block_size": args.block_size, "engine": args.engine,
+        "color": args.color, "target_psnr": args.target_psnr, "target_size": args.target_size
+    }
+    recorded = load_parameters(args.output)
+    jobs = []
+    skipped = 0
+    outputs = set()
+    for path in paths:
+        output_path = output_path_for(path, args.output, args.format)
+        if output_path in outputs:
+            print(f"Advertencia: {path} se omite porque {output_path} ya corresponde a otra imagen", file=sys.stderr)
+            continue
+        outputs.add(output_path)
+        name = os.path.basename(output_path)
+        if not args.force and is_up_to_date(path, output_path, recorded.get(name), parameters):
+            skipped += 1
+            continue
+        jobs.append((path, output_path))
+
+    results = []
+    failures = 0
+    start = time.perf_counter()
+    # Cada proceso ejecuta una canalización completa; varios archivos avanzan a la vez
+    memory_budget = (args.memory_budget or DEFAULT_MEMORY_BUDGET) // args.workers
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {
+                executor.submit(compress_file, path, output_path, args.format, args.rate, args.block_size,
+                                memory_budget, args.target_psnr, args.target_size, args.color,
+                                args.engine): path
+                for path, output_path in jobs
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failures += 1
+                    print(f"Error al procesar {futures[future]}: {e}", file=sys.stderr)
+                    continue
+                results.append(result)
+                recorded[os.path.basename(result["output"])] = parameters
+                print_result(result)
+    finally:
+        save_parameters(args.output, recorded)
+    elapsed = time.perf_counter() - start
+
+    megapixels = sum(r["megapixels"] for r in results)
+    saved = sum(r["input_bytes"] - r["output_bytes"] for r in results)
+    print(
+        f"\n{len(results)} imágenes comprimidas, {skipped} omitidas (actualizadas), {failures} con error. "
+        f"{megapixels:.2f} MP en {elapsed:.2f} s ({megapixels / elapsed if elapsed else 0:.2f} MP/s). "
+        f"Bytes ahorrados: {saved}"
+    )
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compresión DCT de imágenes por lotes, sin interfaz gráfica")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compress = subparsers.add_parser("compress", help="Comprimir directorios o patrones glob de imágenes")
+    compress.add_argument("inputs", nargs="+", help="Directorios o patrones glob de entrada")
+    compress.add_argument("-o", "--output", required=True, help="Directorio de salida")
+    compress.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="jpg")
+    compress.add_argument("-r", "--rate", type=float, default=compression_rate)
+    compress.add_argument("-e", "--engine", choices=ENGINES, default="dct",
+                          help="Transformada: DCT por bloques u ondículas (haar, cdf53)")
+    compress.add_argument("-c", "--color", choices=sorted(COLOR_MODES), default="rgb",
+                          help="ycbcr transforma la crominancia con submuestreo 4:2:0")
+    target = compress.add_mutually_exclusive_group()
+    target.add_argument("--target-psnr", type=float, help="PSNR mínimo en dB del archivo guardado; elige la tasa automáticamente")
+    target.add_argument("--target-size", type=int, help="Tamaño máximo en bytes del archivo .dct")
+    compress.add_argument("-b", "--block-size", type=int, default=block_size_image)
+    compress.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS)
+    compress.add_argument("--memory-budget", type=int,
+                          help="Memoria de trabajo total en bytes, repartida entre los trabajadores "
+                               f"(por defecto {DEFAULT_MEMORY_BUDGET}); solo con --engine dct, las ondículas "
+                               "transforman cada canal entero")
+    compress.add_argument("--force", action="store_true", help="Recomprimir aunque la salida esté actualizada")
+    compress.set_defaults(handler=compress_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
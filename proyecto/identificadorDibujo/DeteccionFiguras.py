@@ -1,123 +1,245 @@
+import argparse
+import os
+import sys
+from functools import lru_cache
+
 import cv2
+import joblib
 import numpy as np
 from sklearn.svm import SVC
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import make_pipeline
 
-def extract_features(image):
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from archivos import IMAGE_EXTENSIONS, save_atomically
+from cacheResultados import file_digest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Carpeta de imágenes de entrenamiento de cada etiqueta, relativa a este archivo
+TRAINING_DIRS = {0: "circulos", 1: "cuadrados", 2: "triangulos"}
+CLASSIFIER_DIR = os.environ.get(
+    "FIGURAS_MODELO", os.path.join(os.path.expanduser("~"), ".cache", "figuras")
+)
+CLASSIFIER_PATH = os.path.join(CLASSIFIER_DIR, "clasificador.joblib")
+FEATURES_PATH = os.path.join(CLASSIFIER_DIR, "caracteristicas.npz")
+# Cambiarla al modificar extract_features invalida las características guardadas
+FEATURE_VERSION = 2
+GRADIENT_THRESHOLD = 50
+# Contornos con menos área (en píxeles) se consideran ruido
+MIN_CONTOUR_AREA = 100
+
+# Diccionario para mapear etiquetas numéricas a nombres
+shape_mapping = {0: "Círculo", 1: "Cuadrado", 2: "Triángulo"}
+
+# cv2.imread descarta el canal alfa y el fondo transparente queda negro; se compone sobre blanco
+def load_image(path):
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is not None and image.ndim == 3 and image.shape[2] == 4:
+        alpha = image[..., 3:].astype(np.float32) / 255
+        image = (image[..., :3] * alpha + 255 * (1 - alpha)).astype(np.uint8)
+    return image
+
+
+# Magnitud del gradiente de Sobel en float32 normalizada a 0-255
+def gradient_magnitude(image):
     # Convertir la imagen a escala de grises usando promedio
-    gray = np.mean(image, axis=2).astype(np.uint8)
-
-    # Cálculo de gradientes (Sobel)
-    kernel_x = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
-    kernel_y = np.array([[1, 2, 1], [0, 0, 0], [-1, -2, -1]])
-    Gx = cv2.filter2D(gray, -1, kernel_x)
-    Gy = cv2.filter2D(gray, -1, kernel_y)
-
-    # Cálculo correcto de la magnitud de gradiente
-    Gt = np.sqrt(Gx**2 + Gy**2)
-
-    # Normalización de Gt
-    GtN = (Gt / np.max(Gt)) * 255
-    GtN = GtN.astype(np.uint8)
-
-    # Normalización de Gx y Gy con offset
-    VminGx = np.min(Gx)
-    VminGy = np.min(Gy)
-    GradOffx = Gx - VminGx
-    GradOffy = Gy - VminGy
-    VmaxGx = np.max(GradOffx)
-    VmaxGy = np.max(GradOffy)
-    GxN = (GradOffx / VmaxGx) * 255
-    GyN = (GradOffy / VmaxGy) * 255
-    GxN = GxN.astype(np.uint8)
-    GyN = GyN.astype(np.uint8)
+    gray = image.mean(axis=2, dtype=np.float32) if image.ndim == 3 else image.astype(np.float32)
+    Gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0)
+    Gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1)
+    Gt = cv2.magnitude(Gx, Gy)
+    Gmax = Gt.max()
+    return (Gt * (255 / Gmax) if Gmax > 0 else Gt).astype(np.uint8)
+
 
+def find_contours(image, min_area=MIN_CONTOUR_AREA):
     # Binarización de la imagen gradiente
-    _, B = cv2.threshold(GtN, 50, 255, cv2.THRESH_BINARY)
-
-    # Calcular momentos de Hu
-    moments = cv2.HuMoments(cv2.moments(B)).flatten()
-
-    return moments
-
-# Rutas específicas de las imágenes de entrenamiento
-
-circle_files = [
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\circulos\circle_PNG2.png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\circulos\circle_PNG27.png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\circulos\OIP.png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\circulos\R (2).png"
-]
-
-square_files = [
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\cuadrados\61cddf9cfe50f4baaa8f472c253d1cb4-2d-cuadrado-by-vexels.png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\cuadrados\R (1).png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\cuadrados\R.png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\cuadrados\square_PNG24.png"
-]
-
-triangle_files = [
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\triangulos\triangle_PNG16.png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\triangulos\triangle_PNG51.png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\triangulos\triangle_PNG72.png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\triangulos\triangle_PNG82.png",
-    r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\triangulos\triangle_PNG84.png"
-]
-
-def load_images(file_list):
-    images = []
-    for file in file_list:
-        img = cv2.imread(file)
-        if img is not None:
-            images.append(img)
-        else:
-            print(f"Warning: No se pudo cargar la imagen: {file}")
-    return images
+    _, B = cv2.threshold(gradient_magnitude(image), GRADIENT_THRESHOLD, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(B, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return [contour for contour in contours if cv2.contourArea(contour) >= min_area]
 
-# Cargar imágenes
-circle_images = load_images(circle_files)
-square_images = load_images(square_files)
-triangle_images = load_images(triangle_files)
 
-# Diccionario para mapear etiquetas numéricas a nombres
-shape_mapping = {0: "Círculo", 1: "Cuadrado", 2: "Triángulo"}
+# Momentos de Hu de cada contorno en escala logarítmica con signo: una fila por contorno
+def hu_features(contours):
+    if not contours:
+        return np.empty((0, 7))
+    moments = np.array([cv2.HuMoments(cv2.moments(contour)).ravel() for contour in contours])
+    return -np.sign(moments) * np.log10(np.abs(moments) + 1e-30)
 
-# Extraer características y etiquetas
-X_train = []
-y_train = []
 
-image_sets = [circle_images, square_images, triangle_images]
+def extract_contour_features(image):
+    contours = find_contours(image)
+    boxes = np.array([cv2.boundingRect(contour) for contour in contours], dtype=np.int32).reshape(-1, 4)
+    return hu_features(contours), boxes
 
-for label, images in enumerate(image_sets):
-    for img in images:
-        features = extract_features(img)
+
+# Características de la figura más grande: cada imagen de entrenamiento contiene una sola
+def extract_features(image):
+    contours = find_contours(image)
+    if not contours:
+        return np.zeros(7)
+    return hu_features([max(contours, key=cv2.contourArea)])[0]
+
+
+def training_files(base_dir=current_dir):
+    files = []
+    for label, folder in TRAINING_DIRS.items():
+        folder = os.path.join(base_dir, folder)
+        for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                files.append((os.path.join(folder, name), label))
+    return files
+
+
+# Características ya extraídas por huella de contenido: {digest: (features, label)}
+def load_feature_store(path=FEATURES_PATH):
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != FEATURE_VERSION:
+                return {}
+            return {
+                str(digest): (features, int(label))
+                for digest, features, label in zip(data["digests"], data["features"], data["labels"])
+            }
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+# Solo se extraen las características de las imágenes nuevas o modificadas; el SVM se
+# reajusta si el conjunto de entrenamiento cambió o no hay un clasificador guardado de esta versión
+def train(base_dir=current_dir, force=False, classifier_path=CLASSIFIER_PATH, features_path=FEATURES_PATH):
+    store = {} if force else load_feature_store(features_path)
+    digests, X_train, y_train = [], [], []
+    new_images = 0
+    for path, label in training_files(base_dir):
+        digest = file_digest(path)
+        if digest in digests:
+            continue
+        if digest in store and store[digest][1] == label:
+            features = store[digest][0]
+        else:
+            img = load_image(path)
+            if img is None:
+                print(f"Warning: No se pudo cargar la imagen: {path}")
+                continue
+            features = extract_features(img)
+            new_images += 1
+        digests.append(digest)
         X_train.append(features)
         y_train.append(label)
 
-X_train = np.array(X_train)
-y_train = np.array(y_train)
+    if not X_train:
+        raise ValueError(f"No hay imágenes de entrenamiento en {base_dir}")
+    if not (force or new_images or set(digests) != set(store)):
+        clf = read_classifier(classifier_path)
+        if clf is not None:
+            return clf, 0, False
+
+    X_train = np.array(X_train)
+    y_train = np.array(y_train)
+
+    # Entrenar el clasificador SVM
+    clf = make_pipeline(StandardScaler(), SVC(kernel='linear'))
+    clf.fit(X_train, y_train)
+
+    save_atomically(features_path, lambda path: np.savez(
+        path, version=FEATURE_VERSION, digests=np.array(digests), features=X_train, labels=y_train
+    ))
+    save_atomically(classifier_path, lambda path: joblib.dump({"version": FEATURE_VERSION, "pipeline": clf}, path))
+    load_classifier.cache_clear()
+    return clf, new_images, True
+
+
+# El clasificador guardado solo vale si se ajustó con la misma versión de extract_features
+def read_classifier(classifier_path=CLASSIFIER_PATH):
+    try:
+        saved = joblib.load(classifier_path)
+    except (OSError, ValueError, EOFError):
+        return None
+    if not isinstance(saved, dict) or saved.get("version") != FEATURE_VERSION:
+        return None
+    return saved["pipeline"]
+
+
+# Se carga una sola vez por proceso; sin clasificador válido se entrena con las imágenes del proyecto
+@lru_cache(maxsize=None)
+def load_classifier(classifier_path=CLASSIFIER_PATH):
+    clf = read_classifier(classifier_path)
+    if clf is None:
+        clf = train(classifier_path=classifier_path)[0]
+    return clf
 
-# Entrenar el clasificador SVM
-clf = make_pipeline(StandardScaler(), SVC(kernel='linear'))
-clf.fit(X_train, y_train)
 
 # Función para predecir la forma
 def predict_shape(image):
     features = extract_features(image)
-    prediction = clf.predict([features])
+    prediction = load_classifier().predict([features])
     return prediction[0]
 
-# Probar con una imagen
-test_image_path = r"C:\Users\nicol\Downloads\proyecto (2)\proyecto\identificadorDibujo\cuadrados\61cddf9cfe50f4baaa8f472c253d1cb4-2d-cuadrado-by-vexels.png"
-test_image = cv2.imread(test_image_path)
-
-if test_image is None:
-    raise FileNotFoundError(f"No se pudo cargar la imagen: {test_image_path}")
-
-shape = predict_shape(test_image)
-print("Forma detectada:", shape_mapping.get(shape, "Desconocida"))
 
-cv2.imshow("Imagen a detectar", test_image)
-cv2.waitKey(0)
-cv2.destroyAllWindows()
+# Todas las figuras de la imagen con una sola llamada a predict: (etiquetas, cajas x, y, w, h)
+def predict_shapes(image):
+    features, boxes = extract_contour_features(image)
+    if not len(features):
+        return np.empty(0, dtype=int), boxes
+    return load_classifier().predict(features), boxes
+
+
+def annotate(image, labels, boxes):
+    annotated = image.copy()
+    for label, (x, y, w, h) in zip(labels, boxes):
+        cv2.rectangle(annotated, (int(x), int(y)), (int(x + w), int(y + h)), (0, 0, 255), 2)
+        cv2.putText(annotated, shape_mapping.get(label, "?"), (int(x), max(int(y) - 5, 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+    return annotated
+
+
+def train_command(args):
+    clf, new_images, trained = train(args.images, args.force)
+    if trained:
+        print(f"Clasificador guardado en {CLASSIFIER_PATH} ({new_images} imágenes nuevas procesadas).")
+    else:
+        print(f"Sin cambios en el conjunto de entrenamiento; se conserva {CLASSIFIER_PATH}.")
+    return 0
+
+
+def predict_command(args):
+    failures = 0
+    for path in args.images:
+        image = load_image(path)
+        if image is None:
+            print(f"No se pudo cargar la imagen: {path}", file=sys.stderr)
+            failures += 1
+            continue
+        labels, boxes = predict_shapes(image)
+        counts = [f"{name}: {np.count_nonzero(labels == label)}" for label, name in shape_mapping.items()]
+        print(f"{path}: {', '.join(counts)}")
+        if args.show:
+            cv2.imshow("Imagen a detectar", annotate(image, labels, boxes))
+            cv2.waitKey(0)
+    if args.show:
+        cv2.destroyAllWindows()
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clasificador SVM de círculos, cuadrados y triángulos")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Extraer características de las imágenes nuevas y guardar el clasificador")
+    train_parser.add_argument("--images", default=current_dir,
+                              help="Directorio con las carpetas " + ", ".join(TRAINING_DIRS.values()))
+    train_parser.add_argument("--force", action="store_true", help="Volver a procesar todas las imágenes")
+    train_parser.set_defaults(handler=train_command)
+
+    predict = subparsers.add_parser("predict", help="Clasificar todas las figuras de una o más imágenes")
+    predict.add_argument("images", nargs="+")
+    predict.add_argument("--show", action="store_true", help="Mostrar cada imagen con las figuras marcadas")
+    predict.set_defaults(handler=predict_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
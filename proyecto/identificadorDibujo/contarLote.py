@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from archivos import DEFAULT_WORKERS, find_images, output_path_for
+from figuras import SHAPE_NAMES, SHAPES, annotate, cached_shapes, find_shapes, read_image
+
+
+# Se ejecuta en un proceso trabajador; los errores vuelven como resultado para no cortar el lote
+def count_file(input_path, annotated_path=None, use_cache=True, expected_size=None):
+    start = time.perf_counter()
+    try:
+        img = read_image(input_path) if annotated_path or not use_cache else None
+        if use_cache:
+            boxes = cached_shapes(input_path, img, expected_size=expected_size)
+        else:
+            boxes = find_shapes(img, expected_size=expected_size)
+        result = {
+            "input": input_path,
+            "counts": {shape: len(found) for shape, found in boxes.items()},
+            "boxes": {shape: found.tolist() for shape, found in boxes.items()},
+        }
+        if annotated_path:
+            result["annotated"] = annotated_path
+            cv2.imwrite(result["annotated"], annotate(img, boxes))
+    except Exception as e:
+        result = {"input": input_path, "error": str(e)}
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def count_command(args):
+    paths = find_images(args.inputs)
+    if not paths:
+        print("No se encontraron imágenes para analizar.", file=sys.stderr)
+        return 1
+    annotated = [None] * len(paths)
+    if args.annotate:
+        os.makedirs(args.annotate, exist_ok=True)
+        # Las imágenes anotadas se nombran por el nombre base: si dos entradas coinciden, la segunda
+        # se cuenta igual pero no se anota para no pisar a la primera
+        outputs = set()
+        for index, path in enumerate(paths):
+            output_path = output_path_for(path, args.annotate, "png")
+            if output_path in outputs:
+                print(f"Advertencia: {path} no se anota porque {output_path} ya corresponde a otra imagen", file=sys.stderr)
+                continue
+            outputs.add(output_path)
+            annotated[index] = output_path
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    counted = failures = 0
+    totals = dict.fromkeys(SHAPES, 0)
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            # Los resultados se escriben en orden de entrada a medida que terminan
+            work = partial(count_file, use_cache=not args.no_cache, expected_size=args.expected_size)
+            for result in executor.map(work, paths, annotated, chunksize=args.chunk_size):
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+                if "error" in result:
+                    failures += 1
+                    print(f"Error al procesar {result['input']}: {result['error']}", file=sys.stderr)
+                else:
+                    counted += 1
+                    for shape, count in result["counts"].items():
+                        totals[shape] += count
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+
+    shapes = ", ".join(f"{totals[shape]} {SHAPE_NAMES[shape]}" for shape in SHAPES)
+    print(
+        f"{counted} imágenes analizadas, {failures} con error; {shapes}. "
+        f"{elapsed:.2f} s ({counted / elapsed if elapsed else 0:.1f} imágenes/s).",
+        file=sys.stderr
+    )
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conteo de figuras por lotes, sin interfaz gráfica")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    count = subparsers.add_parser("count", help="Contar figuras en directorios o patrones glob de imágenes")
+    count.add_argument("inputs", nargs="+", help="Directorios o patrones glob de entrada")
+    count.add_argument("-o", "--output", default="-", help="Archivo JSON lines de resultados (- para la salida estándar)")
+    count.add_argument("-a", "--annotate", help="Directorio donde guardar las imágenes con las figuras marcadas")
+    count.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS)
+    count.add_argument("--chunk-size", type=int, default=16, help="Imágenes por envío a cada proceso")
+    count.add_argument("--expected-size", type=int,
+                       help="Lado aproximado de las figuras en píxeles: detecta sobre un nivel reducido de la pirámide")
+    count.add_argument("--no-cache", action="store_true", help="Analizar siempre, sin la caché de resultados")
+    count.set_defaults(handler=count_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
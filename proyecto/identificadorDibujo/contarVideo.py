@@ -0,0 +1,215 @@
+import argparse
+import json
+import math
+import queue
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from figuras import SHAPE_NAMES, SHAPES, annotate, find_shapes
+
+DEFAULT_TARGET_FPS = 30.0
+DEFAULT_MAX_SKIP = 4
+DEFAULT_QUEUE_SIZE = 8
+FALLBACK_FPS = 30.0
+FOURCC = "mp4v"
+# Diferencia de gris (0-255) a partir de la cual un píxel se considera cambiado
+DIFF_THRESHOLD = 25
+# Con menos píxeles cambiados que esta fracción se reutiliza el resultado anterior completo
+UNCHANGED_FRACTION = 0.0005
+# Si las zonas cambiadas cubren más que esta fracción del cuadro se analiza el cuadro entero
+FULL_FRAME_FRACTION = 0.5
+REGION_PADDING = 16
+# Peso de la última medida en la estimación del coste de analizar un cuadro
+COST_SMOOTHING = 0.2
+
+
+# Hilo decodificador: la cola acotada frena la lectura si el análisis va por detrás
+def read_frames(capture, frames, stop):
+    while not stop.is_set():
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.put(frame)
+    frames.put(None)
+
+
+def write_frames(writer, frames):
+    while True:
+        frame = frames.get()
+        if frame is None:
+            break
+        writer.write(frame)
+
+
+def empty_boxes():
+    return {shape: np.empty((0, 4), dtype=np.int32) for shape in SHAPES}
+
+
+# Zonas a volver a analizar: los cambios ampliados con las figuras anteriores que tocan,
+# rellenados como rectángulos y fusionados hasta que ninguno se solapa con otro
+def refresh_regions(changed_mask, previous_boxes, padding=REGION_PADDING):
+    mask = cv2.dilate(changed_mask, np.ones((2 * padding + 1, 2 * padding + 1), np.uint8))
+    boxes = [box for found in previous_boxes.values() for box in found]
+    while True:
+        before = cv2.countNonZero(mask)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        regions = [cv2.boundingRect(contour) for contour in contours]
+        for x, y, w, h in regions:
+            mask[y:y + h, x:x + w] = 255
+        for x, y, w, h in boxes:
+            if mask[y:y + h, x:x + w].any():
+                mask[max(y - padding, 0):y + h + padding, max(x - padding, 0):x + w + padding] = 255
+        if cv2.countNonZero(mask) == before:
+            return regions
+
+
+def inside_any(box, regions):
+    x, y, w, h = box
+    return any(rx <= x and ry <= y and x + w <= rx + rw and y + h <= ry + rh for rx, ry, rw, rh in regions)
+
+
+# Conserva las figuras fuera de las zonas cambiadas y detecta de nuevo solo dentro de ellas
+def update_shapes(frame, previous_boxes, regions):
+    boxes = {
+        shape: [found[np.array([not inside_any(box, regions) for box in found], dtype=bool)]]
+        for shape, found in previous_boxes.items()
+    }
+    for x, y, w, h in regions:
+        for shape, found in find_shapes(frame[y:y + h, x:x + w]).items():
+            boxes[shape].append(found + np.array([x, y, 0, 0], dtype=np.int32))
+    return {shape: np.concatenate(found) for shape, found in boxes.items()}
+
+
+# Recorre el vídeo contando figuras. Cada cuadro se resuelve de una de estas formas:
+#   "full": se analiza entero; "regions": solo las zonas que cambiaron desde el último análisis;
+#   "unchanged": no cambió nada y se reutiliza el resultado; "skipped": se salta para sostener target_fps.
+# Devuelve (cuadro, resultado) por cada cuadro decodificado.
+def stream_shapes(capture, target_fps=DEFAULT_TARGET_FPS, max_skip=DEFAULT_MAX_SKIP, queue_size=DEFAULT_QUEUE_SIZE):
+    frames = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    decoder = threading.Thread(target=read_frames, args=(capture, frames, stop), daemon=True)
+    decoder.start()
+
+    boxes = empty_boxes()
+    reference = None
+    cost = 0.0
+    pending_skips = 0
+    index = 0
+    try:
+        while True:
+            frame = frames.get()
+            if frame is None:
+                break
+            if pending_skips:
+                pending_skips -= 1
+                source = "skipped"
+            else:
+                start = time.perf_counter()
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                if reference is None or reference.shape != gray.shape:
+                    source, boxes = "full", find_shapes(frame)
+                else:
+                    _, changed = cv2.threshold(cv2.absdiff(gray, reference), DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)
+                    if cv2.countNonZero(changed) < UNCHANGED_FRACTION * changed.size:
+                        source = "unchanged"
+                    else:
+                        regions = refresh_regions(changed, boxes)
+                        if sum(w * h for _, _, w, h in regions) > FULL_FRAME_FRACTION * changed.size:
+                            source, boxes = "full", find_shapes(frame)
+                        else:
+                            source, boxes = "regions", update_shapes(frame, boxes, regions)
+                if source != "unchanged":
+                    reference = gray
+                # Saltar tantos cuadros como el análisis tarda en exceso del presupuesto por cuadro
+                elapsed = time.perf_counter() - start
+                cost = elapsed if index == 0 else (1 - COST_SMOOTHING) * cost + COST_SMOOTHING * elapsed
+                pending_skips = min(max(math.ceil(cost * target_fps) - 1, 0), max_skip)
+            yield frame, {"frame": index, "source": source, "boxes": boxes}
+            index += 1
+    finally:
+        stop.set()
+        # Vaciar la cola desbloquea al decodificador si estaba esperando para encolar
+        while decoder.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        decoder.join()
+
+
+def count_command(args):
+    capture = cv2.VideoCapture(args.input)
+    if not capture.isOpened():
+        print(f"No se pudo abrir el vídeo: {args.input}", file=sys.stderr)
+        return 1
+    fps = capture.get(cv2.CAP_PROP_FPS) or FALLBACK_FPS
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    written = None
+    writer_thread = None
+    sources = dict.fromkeys(("full", "regions", "unchanged", "skipped"), 0)
+    frames = 0
+    start = time.perf_counter()
+    try:
+        for frame, result in stream_shapes(capture, args.target_fps, args.max_skip, args.queue_size):
+            if args.annotate and writer_thread is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(args.annotate, cv2.VideoWriter_fourcc(*args.fourcc), fps, (width, height))
+                if not writer.isOpened():
+                    raise ValueError(f"No se pudo crear el vídeo anotado: {args.annotate}")
+                written = queue.Queue(maxsize=args.queue_size)
+                writer_thread = threading.Thread(target=write_frames, args=(writer, written), daemon=True)
+                writer_thread.start()
+            if written is not None:
+                written.put(annotate(frame, result["boxes"]))
+
+            boxes = result.pop("boxes")
+            result["counts"] = {shape: len(found) for shape, found in boxes.items()}
+            result["boxes"] = {shape: found.tolist() for shape, found in boxes.items()}
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            sources[result["source"]] += 1
+            frames += 1
+    finally:
+        if writer_thread is not None:
+            written.put(None)
+            writer_thread.join()
+            writer.release()
+        capture.release()
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{frames} cuadros en {elapsed:.2f} s: {frames / elapsed if elapsed else 0:.1f} cuadros/s sostenidos "
+        f"(objetivo {args.target_fps:g}, vídeo a {fps:g}). Analizados enteros {sources['full']}, "
+        f"por zonas {sources['regions']}, sin cambios {sources['unchanged']}, saltados {sources['skipped']}.",
+        file=sys.stderr
+    )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Conteo de figuras en vídeo, cuadro a cuadro")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    count = subparsers.add_parser("count", help="Contar " + ", ".join(SHAPE_NAMES.values()) + " en cada cuadro")
+    count.add_argument("input", help="Archivo de vídeo o secuencia de imágenes (por ejemplo cuadro_%%04d.png)")
+    count.add_argument("-o", "--output", default="-", help="Archivo JSON lines con el conteo de cada cuadro (- para la salida estándar)")
+    count.add_argument("-a", "--annotate", help="Vídeo de salida con las figuras marcadas")
+    count.add_argument("--fourcc", default=FOURCC, help="Códec del vídeo anotado")
+    count.add_argument("--target-fps", type=float, default=DEFAULT_TARGET_FPS,
+                       help="Cuadros por segundo a sostener; por debajo se saltan cuadros")
+    count.add_argument("--max-skip", type=int, default=DEFAULT_MAX_SKIP, help="Máximo de cuadros seguidos sin analizar")
+    count.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Cuadros decodificados en espera")
+    count.set_defaults(handler=count_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
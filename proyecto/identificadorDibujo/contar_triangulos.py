@@ -35,30 +35,24 @@ def check_dependencies():
 def detect_triangles(image_path):
     try:
         import cv2
+        from figuras import SHAPE_NAMES, annotate, automatic_expected_size, cached_shapes
         img = cv2.imread(image_path)
         if img is None:
             messagebox.showerror("Error", f"No se pudo cargar la imagen: {image_path}")
             return
         
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-        
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        triangle_count = 0
-        
-        for contour in contours:
-            approx = cv2.approxPolyDP(contour, 0.03 * cv2.arcLength(contour, True), True)
-            if len(approx) == 3:
-                triangle_count += 1
-                x, y, w, h = cv2.boundingRect(approx)
-                cv2.rectangle(img, (x, y), (x + w, y + h), (0, 0, 255), 2)
+        # Una sola pasada cuenta todas las figuras; la misma imagen se resuelve desde la caché.
+        # Las fotos grandes se analizan sobre la pirámide
+        boxes = cached_shapes(image_path, img, expected_size=automatic_expected_size(img))
+        triangle_count = len(boxes["triangulo"])
         
         result_text = f"Se han detectado {triangle_count} triángulos"
+        others = [f"{len(found)} {SHAPE_NAMES[shape]}" for shape, found in boxes.items() if shape != "triangulo" and len(found)]
+        if others:
+            result_text += "\nOtras figuras: " + ", ".join(others)
         messagebox.showinfo("Resultado", result_text)
         
-        cv2.imshow('Triangulos Detectados', img)
+        cv2.imshow('Triangulos Detectados', annotate(img, boxes))
         cv2.waitKey(0)
         cv2.destroyAllWindows()
     
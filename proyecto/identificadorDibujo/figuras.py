@@ -0,0 +1,167 @@
+import math
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cacheResultados import ResultCache, file_digest, fingerprint
+
+SHAPES = ("triangulo", "cuadrado", "rectangulo", "circulo")
+SHAPE_NAMES = {"triangulo": "triángulos", "cuadrado": "cuadrados", "rectangulo": "rectángulos", "circulo": "círculos"}
+SHAPE_COLORS = {"triangulo": (0, 0, 255), "cuadrado": (0, 200, 0), "rectangulo": (255, 128, 0), "circulo": (0, 200, 255)}
+SHAPE_PARAMETERS = {
+    "canny": (50, 150),
+    "aperture": 3,
+    "epsilon": 0.03,
+    # Contornos con menos área (en píxeles) se descartan antes de aproximarlos
+    "min_area": 100,
+    # 4·pi·área / perímetro²: 1 en un círculo, ~0.785 en un cuadrado, ~0.6 en un triángulo equilátero
+    "circularity": 0.85,
+    "square_aspect": (0.9, 1.1),
+}
+# Pirámide: la figura esperada debe conservar al menos PYRAMID_MIN_SIDE píxeles de lado en el
+# nivel reducido; los candidatos con menos de REFINE_SIDE se vuelven a detectar a resolución completa
+PYRAMID_MIN_SIDE = 64
+REFINE_SIDE = 24
+# Por encima de estos píxeles la detección automática usa la pirámide, suponiendo figuras de al
+# menos 1/EXPECTED_SHAPES_PER_SIDE del lado menor
+LARGE_IMAGE_PIXELS = 8_000_000
+EXPECTED_SHAPES_PER_SIDE = 8
+shape_cache = ResultCache("figuras")
+
+
+def read_image(image_path):
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"No se pudo cargar la imagen: {image_path}")
+    return img
+
+
+def classify_contour(contour, parameters=SHAPE_PARAMETERS):
+    area = cv2.contourArea(contour)
+    if area < parameters["min_area"]:
+        return None
+    perimeter = cv2.arcLength(contour, True)
+    vertices = len(cv2.approxPolyDP(contour, parameters["epsilon"] * perimeter, True))
+    if vertices == 3:
+        return "triangulo"
+    if vertices == 4:
+        _, _, w, h = cv2.boundingRect(contour)
+        low, high = parameters["square_aspect"]
+        return "cuadrado" if low <= w / h <= high else "rectangulo"
+    if vertices > 4 and 4 * np.pi * area / perimeter ** 2 >= parameters["circularity"]:
+        return "circulo"
+    return None
+
+
+def shape_contours(img, parameters=SHAPE_PARAMETERS):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, *parameters["canny"], apertureSize=parameters["aperture"])
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
+
+def pyramid_level(expected_size, min_side=PYRAMID_MIN_SIDE):
+    if not expected_size or expected_size < 2 * min_side:
+        return 0
+    return int(math.log2(expected_size / min_side))
+
+
+# Lado esperado de las figuras para imágenes grandes; None (resolución completa) en las demás
+def automatic_expected_size(img):
+    height, width = img.shape[:2]
+    if height * width <= LARGE_IMAGE_PIXELS:
+        return None
+    return min(height, width) // EXPECTED_SHAPES_PER_SIDE
+
+
+# Una sola pasada de bordes y contornos: cajas (x, y, w, h) por figura; no muestra nada ni modifica la imagen.
+# Con expected_size (lado aproximado de las figuras, en píxeles) se detecta sobre un nivel reducido
+# de la pirámide y las cajas se devuelven en coordenadas de la imagen original.
+def find_shapes(img, parameters=SHAPE_PARAMETERS, expected_size=None):
+    level = pyramid_level(expected_size)
+    if level:
+        return find_shapes_pyramid(img, level, parameters)
+
+    boxes = {shape: [] for shape in SHAPES}
+    for contour in shape_contours(img, parameters):
+        shape = classify_contour(contour, parameters)
+        if shape is not None:
+            boxes[shape].append(cv2.boundingRect(contour))
+    return {shape: np.array(found, dtype=np.int32).reshape(-1, 4) for shape, found in boxes.items()}
+
+
+def find_shapes_pyramid(img, level, parameters=SHAPE_PARAMETERS):
+    small = img
+    for _ in range(level):
+        small = cv2.pyrDown(small)
+    scale_y = img.shape[0] / small.shape[0]
+    scale_x = img.shape[1] / small.shape[1]
+    # El área mínima se escala al nivel: el ruido pequeño desaparece antes de aproximar contornos
+    coarse = dict(parameters, min_area=parameters["min_area"] / (scale_x * scale_y))
+    padding = 2 * math.ceil(max(scale_x, scale_y))
+
+    boxes = {shape: [] for shape in SHAPES}
+    for contour in shape_contours(small, coarse):
+        if cv2.contourArea(contour) < coarse["min_area"]:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        box = (round(x * scale_x), round(y * scale_y), round(w * scale_x), round(h * scale_y))
+        if min(w, h) >= REFINE_SIDE:
+            shape = classify_contour(contour, coarse)
+            if shape is not None:
+                boxes[shape].append(box)
+            continue
+
+        # Candidato demasiado pequeño para aproximarlo en el nivel reducido: se detecta de nuevo en
+        # su recorte a resolución completa y se conservan las figuras centradas dentro de él
+        bx, by, bw, bh = box
+        x0, y0 = max(bx - padding, 0), max(by - padding, 0)
+        crop = img[y0:by + bh + padding, x0:bx + bw + padding]
+        for shape, found in find_shapes(crop, parameters).items():
+            for fx, fy, fw, fh in found:
+                center_x, center_y = x0 + fx + fw / 2, y0 + fy + fh / 2
+                if bx <= center_x <= bx + bw and by <= center_y <= by + bh:
+                    boxes[shape].append((x0 + fx, y0 + fy, fw, fh))
+    return {shape: np.array(found, dtype=np.int32).reshape(-1, 4) for shape, found in boxes.items()}
+
+
+def count_shapes(img, parameters=SHAPE_PARAMETERS):
+    boxes = find_shapes(img, parameters)
+    return {shape: len(found) for shape, found in boxes.items()}, boxes
+
+
+def find_triangles(img):
+    return find_shapes(img)["triangulo"]
+
+
+def count_triangles(img):
+    boxes = find_triangles(img)
+    return len(boxes), boxes
+
+
+# Cajas por figura desde la caché de resultados; la imagen solo se decodifica si no hay resultado guardado
+def cached_shapes(image_path, img=None, parameters=SHAPE_PARAMETERS, expected_size=None):
+    key = fingerprint(file_digest(image_path), "figuras", parameters, expected_size)
+    cached = shape_cache.get(key)
+    if cached is not None:
+        return {shape: cached[shape] for shape in SHAPES}
+    boxes = find_shapes(read_image(image_path) if img is None else img, parameters, expected_size)
+    shape_cache.put(key, boxes)
+    return boxes
+
+
+def cached_triangles(image_path, img=None):
+    return cached_shapes(image_path, img)["triangulo"]
+
+
+# `boxes` es un array de cajas (triángulos) o un diccionario de cajas por figura
+def annotate(img, boxes, color=SHAPE_COLORS["triangulo"]):
+    annotated = img.copy()
+    groups = boxes.items() if isinstance(boxes, dict) else [(None, boxes)]
+    for shape, shape_boxes in groups:
+        for x, y, w, h in shape_boxes:
+            cv2.rectangle(annotated, (int(x), int(y)), (int(x + w), int(y + h)), SHAPE_COLORS.get(shape, color), 2)
+    return annotated
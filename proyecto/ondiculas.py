@@ -0,0 +1,201 @@
+import struct
+
+import numpy as np
+
+from compresion import (
+    COLOR_MODES, ENTROPY_CODECS, block_size_image, channel_count, color_planes, compression_rate, entropy_decode,
+    entropy_encode, keep_size_for, merge_planes, plane_shapes, to_uint8, uses_ycbcr
+)
+
+WAVELETS = ("haar", "cdf53")
+DEFAULT_WAVELET_LEVELS = 5
+
+
+def take(x, index, axis):
+    return x[(slice(None),) * axis + (index,)]
+
+
+def neighbor_right(even, n_odd, axis):
+    if even.shape[axis] > n_odd:
+        return take(even, slice(1, n_odd + 1), axis)
+    return np.concatenate([take(even, slice(1, None), axis), take(even, slice(-1, None), axis)], axis=axis)
+
+
+def detail_neighbors(detail, n_even, axis):
+    first, last = take(detail, slice(0, 1), axis), take(detail, slice(-1, None), axis)
+    if n_even > detail.shape[axis]:
+        return np.concatenate([first, detail], axis=axis), np.concatenate([detail, last], axis=axis)
+    return np.concatenate([first, take(detail, slice(None, -1), axis)], axis=axis), detail
+
+
+# Esquema de lifting a lo largo de un eje: devuelve (aproximación, detalle) con extensión simétrica
+def lifting_forward(x, wavelet, axis=0):
+    even, odd = take(x, slice(0, None, 2), axis), take(x, slice(1, None, 2), axis)
+    n_odd = odd.shape[axis]
+    if wavelet == "haar":
+        detail = odd - take(even, slice(0, n_odd), axis)
+        approximation = even.copy()
+        take(approximation, slice(0, n_odd), axis)[...] += detail / 2
+        return approximation, detail
+
+    detail = take(even, slice(0, n_odd), axis) + neighbor_right(even, n_odd, axis)
+    detail *= -0.5
+    detail += odd
+    if n_odd == 0:
+        return even.copy(), detail
+    left, current = detail_neighbors(detail, even.shape[axis], axis)
+    approximation = left + current
+    approximation *= 0.25
+    approximation += even
+    return approximation, detail
+
+
+def lifting_inverse(approximation, detail, wavelet, out, axis=0):
+    n_odd = detail.shape[axis]
+    even_out, odd_out = take(out, slice(0, None, 2), axis), take(out, slice(1, None, 2), axis)
+    if wavelet == "haar":
+        even_out[...] = approximation
+        take(even_out, slice(0, n_odd), axis)[...] -= detail / 2
+        np.add(detail, take(even_out, slice(0, n_odd), axis), out=odd_out)
+        return out
+    if n_odd == 0:
+        even_out[...] = approximation
+        return out
+    left, current = detail_neighbors(detail, approximation.shape[axis], axis)
+    np.add(left, current, out=even_out)
+    even_out *= -0.25
+    even_out += approximation
+    np.add(take(even_out, slice(0, n_odd), axis), neighbor_right(even_out, n_odd, axis), out=odd_out)
+    odd_out *= 0.5
+    odd_out += detail
+    return out
+
+
+def level_shapes(h, w, levels):
+    shapes = []
+    for _ in range(levels):
+        if h < 2 or w < 2:
+            break
+        shapes.append((h, w))
+        h, w = (h + 1) // 2, (w + 1) // 2
+    return shapes
+
+
+# Descomposición multinivel en disposición de Mallat: la aproximación queda arriba a la izquierda
+def dwt2(img, levels=DEFAULT_WAVELET_LEVELS, wavelet="cdf53"):
+    coefficients = np.array(img, dtype=np.float32)
+    for h, w in level_shapes(img.shape[0], img.shape[1], levels):
+        half_h, half_w = (h + 1) // 2, (w + 1) // 2
+        approximation, detail = lifting_forward(coefficients[:h, :w], wavelet, axis=0)
+        coefficients[:half_h, :w], coefficients[half_h:h, :w] = approximation, detail
+        approximation, detail = lifting_forward(coefficients[:h, :w], wavelet, axis=1)
+        coefficients[:h, :half_w], coefficients[:h, half_w:w] = approximation, detail
+    return coefficients
+
+
+def idwt2(coefficients, levels=DEFAULT_WAVELET_LEVELS, wavelet="cdf53"):
+    img = np.array(coefficients, dtype=np.float32)
+    for h, w in reversed(level_shapes(img.shape[0], img.shape[1], levels)):
+        half_h, half_w = (h + 1) // 2, (w + 1) // 2
+        region = img[:h, :w]
+        lifting_inverse(region[:, :half_w].copy(), region[:, half_w:].copy(), wavelet, region, axis=1)
+        lifting_inverse(region[:half_h].copy(), region[half_h:].copy(), wavelet, region, axis=0)
+    return img
+
+
+# Factor que lleva cada subbanda a la escala de una ondícula ortonormal: la aproximación del
+# lifting tiene ganancia 1/2 por nivel y el detalle diagonal ganancia 2
+def significance_weights(h, w, levels=DEFAULT_WAVELET_LEVELS):
+    weights = np.ones((h, w), dtype=np.float32)
+    shapes = level_shapes(h, w, levels)
+    for level, (level_h, level_w) in enumerate(shapes, start=1):
+        half_h, half_w = (level_h + 1) // 2, (level_w + 1) // 2
+        region = weights[:level_h, :level_w]
+        region[:half_h, half_w:] = region[half_h:, :half_w] = 2.0 ** (level - 1)
+        region[half_h:, half_w:] = 2.0 ** (level - 2)
+    if shapes:
+        weights[:(shapes[-1][0] + 1) // 2, :(shapes[-1][1] + 1) // 2] = 2.0 ** len(shapes)
+    return weights
+
+
+# Conserva por canal los coeficientes más significativos
+def keep_significant(coefficients, keep_fraction, levels=DEFAULT_WAVELET_LEVELS):
+    h, w, c = coefficients.shape
+    keep_count = int(round(keep_fraction * h * w))
+    if keep_count >= h * w:
+        return coefficients
+    if keep_count < 1:
+        return np.zeros_like(coefficients)
+    significance = np.abs(coefficients) * significance_weights(h, w, levels)[..., None]
+    per_channel = significance.reshape(h * w, c).T.copy()
+    thresholds = np.partition(per_channel, h * w - keep_count, axis=1)[:, h * w - keep_count]
+    return coefficients * (significance >= thresholds)
+
+
+# Misma cantidad de coeficientes que conserva la DCT por bloques con la misma tasa
+def keep_fraction_for(compression_rate, block_size=block_size_image):
+    return keep_size_for(block_size, compression_rate) ** 2 / block_size ** 2
+
+
+def wavelet_compress_decompress(img, compression_rate=compression_rate, block_size=block_size_image,
+                                wavelet="cdf53", levels=DEFAULT_WAVELET_LEVELS):
+    coefficients = dwt2(img, levels, wavelet)
+    kept = keep_significant(coefficients, keep_fraction_for(compression_rate, block_size), levels)
+    return idwt2(kept, levels, wavelet)
+
+
+# Contenedor: cabecera + por plano, un paso de cuantización por canal y coeficientes int16
+# (mayoritariamente ceros tras la selección) comprimidos por entropía
+WAVELET_MAGIC = b"DWT1"
+WAVELET_HEADER_FORMAT = "<4sIIBBBBB"
+
+
+def encode_wavelet(image, compression_rate=compression_rate, block_size=block_size_image, wavelet="cdf53",
+                   codec="zlib", color_mode="rgb", levels=DEFAULT_WAVELET_LEVELS):
+    if wavelet not in WAVELETS:
+        raise ValueError(f"Ondícula no soportada: {wavelet}")
+    if codec not in ENTROPY_CODECS:
+        raise ValueError(f"Codificador no soportado: {codec}")
+    img = np.asarray(image, dtype=np.float32)
+    h, w = img.shape[:2]
+    channels = channel_count(img)
+    stored_mode = "ycbcr" if uses_ycbcr(color_mode, channels) else "rgb"
+    header = struct.pack(WAVELET_HEADER_FORMAT, WAVELET_MAGIC, h, w, channels, levels,
+                         WAVELETS.index(wavelet), ENTROPY_CODECS[codec], COLOR_MODES[stored_mode])
+
+    segments = []
+    for plane in color_planes(img, color_mode):
+        kept = keep_significant(
+            dwt2(plane, levels, wavelet), keep_fraction_for(compression_rate, block_size), levels)
+        max_values = np.abs(kept).reshape(-1, kept.shape[2]).max(axis=0)
+        steps = np.where(max_values > 0, max_values / np.iinfo(np.int16).max, 1).astype(np.float32)
+        quantized = np.rint(kept / steps).astype(np.int16)
+        payload = entropy_encode(quantized.tobytes(), codec)
+        segments.append(steps.tobytes() + struct.pack("<I", len(payload)) + payload)
+    return header + b"".join(segments)
+
+
+def decode_wavelet(data):
+    header_size = struct.calcsize(WAVELET_HEADER_FORMAT)
+    magic, h, w, channels, levels, wavelet_code, codec_code, color_code = struct.unpack(
+        WAVELET_HEADER_FORMAT, data[:header_size])
+    if magic != WAVELET_MAGIC:
+        raise ValueError("El archivo no es una imagen comprimida con ondículas")
+    wavelet = WAVELETS[wavelet_code]
+    codec = next(name for name, code in ENTROPY_CODECS.items() if code == codec_code)
+    color_mode = next(name for name, code in COLOR_MODES.items() if code == color_code)
+
+    planes = []
+    offset = header_size
+    for plane_h, plane_w, plane_c in plane_shapes((h, w), channels, color_mode):
+        steps = np.frombuffer(data, dtype=np.float32, count=plane_c, offset=offset)
+        offset += plane_c * 4
+        (payload_size,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        quantized = np.frombuffer(entropy_decode(data[offset:offset + payload_size], codec), dtype=np.int16)
+        offset += payload_size
+        coefficients = quantized.reshape(plane_h, plane_w, plane_c).astype(np.float32) * steps
+        planes.append(idwt2(coefficients, levels, wavelet))
+
+    decompressed = merge_planes(planes, (h, w), channels, color_mode)
+    return to_uint8(decompressed, (h, w) if channels == 1 else (h, w, channels))
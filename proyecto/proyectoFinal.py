@@ -65,6 +65,7 @@ def load_reference_vectors(file_path):
 current_dir = os.path.dirname(os.path.abspath(__file__))
 reference_vectors_path = os.path.join(current_dir, "reference_vectors.json")
 vector_referencias = load_reference_vectors(reference_vectors_path)
+segmentation_process = None
 
 def record_audio(filename, duration, fs):
     try:
@@ -182,7 +183,7 @@ def find_command(audio_path, reference_vectors, fs, bw_start, bw_end, num_bands)
         return "Error al procesar el audio"
 
 def process_voice_command():
-    global label_status
+    global label_status, segmentation_process
     if not record_audio(audio_path, 2, fs):
         label_status.configure(text="Error al grabar audio. Intente nuevamente.")
         return
@@ -202,9 +203,13 @@ def process_voice_command():
         except Exception as e:
             label_status.configure(text=f"Error al ejecutar contar_triangulos.py: {e}")
     elif command == "segmentación":
+        # Un único proceso de segmentación con el modelo cargado; se reutiliza mientras siga abierto
+        if segmentation_process is not None and segmentation_process.poll() is None:
+            label_status.configure(text="El programa de segmentación ya está abierto con el modelo cargado.")
+            return
         label_status.configure(text="Comando 'Segmentación' ejecutando: Programa para segmentar imagenes.")
         try:
-            subprocess.run([sys.executable, os.path.join(current_dir, "segmentacion.py")])
+            segmentation_process = subprocess.Popen([sys.executable, os.path.join(current_dir, "segmentacion.py")])
         except Exception as e:
             label_status.configure(text=f"Error al ejecutar segmentacion.py: {e}")
     else:
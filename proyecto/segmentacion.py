@@ -1,8 +1,31 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
+import queue
 import sys
+import threading
 import numpy as np
+from concurrent.futures import Future
+
+from cacheResultados import file_digest
+from segmentador import (
+    BACKBONES, DEFAULT_MODEL, SegmentationCancelled, cached_mask, cached_predict_mask, choose_backbone,
+    decode_segmentation, load_backend, predict_mask, segmentation_fingerprint
+)
+
+AUTOMATIC_MODEL = "Automático"
+# Segundos por imagen a 520 px que se admiten al elegir el modelo automáticamente
+AUTOMATIC_LATENCY_BUDGET = 1.0
+BACKEND_OPTIONS = {"PyTorch": "torch", "ONNX Runtime": "onnx"}
+# La vista previa se infiere a baja resolución y directamente al tamaño de visualización
+PREVIEW_MAX_SIDE = 320
+DISPLAY_SIZE = (300, 300)
+
+# Trabajo de segmentación fuera del hilo de Tk; los resultados vuelven por una cola que el
+# hilo principal vacía con after()
+segmentation_worker = None
+ui_events = queue.Queue()
+current_job = {"cancel": None}
 
 # Configurar apariencia de CustomTkinter
 ctk.set_appearance_mode("dark")
@@ -39,103 +62,143 @@ def check_dependencies():
             return False
     return True
 
-# Función para cargar el modelo
-def load_model():
-    try:
-        import torch
-        from torchvision.models.segmentation import deeplabv3_resnet101
-        model = deeplabv3_resnet101(pretrained=True)
-        model.eval()
-        return model
-    except Exception as e:
-        messagebox.showerror("Error", f"Error al cargar el modelo: {e}")
-        return None
+# Devuelve el modelo y su huella para la caché de resultados
+def load_selected_model(option, backend="torch"):
+    if option == AUTOMATIC_MODEL:
+        option = choose_backbone(AUTOMATIC_LATENCY_BUDGET)
+    return load_backend(option, backend), segmentation_fingerprint(option, backend)
 
-# Función para preprocesar la imagen
-def preprocess_image(image):
-    try:
-        from torchvision import transforms
-        preprocess = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
-        return preprocess(image).unsqueeze(0)  # Agregar dimensión de batch
-    except Exception as e:
-        messagebox.showerror("Error", f"Error al preprocesar la imagen: {e}")
-        return None
+# Hilo daemon que ejecuta en orden las tareas enviadas y devuelve un Future por tarea. A diferencia
+# de ThreadPoolExecutor, el intérprete no lo espera al salir: cerrar la ventana no bloquea por una
+# inferencia o una carga de modelo en curso
+def background_worker():
+    tasks = queue.Queue()
+
+    def run():
+        while True:
+            future, function, args = tasks.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
 
-# Paleta de colores para visualización
-def decode_segmentation(mask):
-    # Mapear cada clase a un color
-    colors = [
-        (0, 0, 0), (128, 0, 0), (0, 128, 0), (128, 128, 0),
-        (0, 0, 128), (128, 0, 128), (0, 128, 128), (128, 128, 128),
-        (64, 0, 0), (192, 0, 0), (64, 128, 0), (192, 128, 0),
-        (64, 0, 128), (192, 0, 128), (64, 128, 128), (192, 128, 128),
-        (0, 64, 0), (128, 64, 0), (0, 192, 0), (128, 192, 0),
-        (0, 64, 128)
-    ]
-
-    # Asignar colores a las clases en la máscara
-    color_mask = Image.new("RGB", (mask.shape[1], mask.shape[0]))
-    pixels = color_mask.load()
-
-    for y in range(mask.shape[0]):
-        for x in range(mask.shape[1]):
-            class_idx = mask[y, x]
-            if class_idx < len(colors):
-                pixels[x, y] = colors[class_idx]
-            else:
-                pixels[x, y] = (0, 0, 0)  # Color negro para clases desconocidas
-
-    return color_mask
+    def submit(function, *args):
+        future = Future()
+        tasks.put((future, function, args))
+        return future
 
+    return submit
+
+
+# Encola una llamada para el hilo principal; se descarta si el trabajo ya fue cancelado
+def post(cancel_event, callback, *args):
+    ui_events.put((cancel_event, callback, args))
+
+
+def process_ui_events(root):
+    while True:
+        try:
+            cancel_event, callback, args = ui_events.get_nowait()
+        except queue.Empty:
+            break
+        if not cancel_event.is_set():
+            callback(*args)
+    root.after(50, process_ui_events, root)
+
+
+def set_status(text):
+    status_label.configure(text=text)
+
+
+def show_error(text):
+    set_status("")
+    messagebox.showerror("Error", text)
 
 # Función para segmentar la imagen
-def segment_image(image, model):
+def segment_image(image, model, model_fingerprint=None, digest=None):
     try:
-        import torch
         # Verificar que el modelo está cargado
         if model is None:
             messagebox.showerror("Error", "El modelo no está cargado correctamente.")
             return None
             
-        input_image = preprocess_image(image)
-        if input_image is None:
-            return None
-            
-        with torch.no_grad():
-            output = model(input_image)["out"][0]  # Salida del modelo
-        mask = output.argmax(0).byte().cpu().numpy()  # Clase con mayor puntuación
-        return decode_segmentation(mask)
+        # Con la huella del contenido, una imagen ya segmentada con el mismo modelo sale de la caché
+        if model_fingerprint is not None and digest is not None:
+            return decode_segmentation(cached_predict_mask(image, model, model_fingerprint, digest))
+        return decode_segmentation(predict_mask(image, model))
     except Exception as e:
         messagebox.showerror("Error", f"Error al segmentar la imagen: {e}")
         return None
 
 
+# Se ejecuta en el hilo trabajador: vista previa rápida y después la máscara a resolución completa
+def segmentation_job(file_path, model_future, cancel_event):
+    try:
+        original_image = Image.open(file_path).convert("RGB")
+        digest = file_digest(file_path)
+        post(cancel_event, set_status, "Cargando el modelo...")
+        try:
+            model, model_fingerprint = model_future.result()
+        except Exception as e:
+            post(cancel_event, show_error, f"Error al cargar el modelo: {e}")
+            return
+        if cancel_event.is_set():
+            return
+
+        mask = cached_mask(model_fingerprint, digest)
+        if mask is None:
+            post(cancel_event, set_status, "Calculando vista previa...")
+            preview = predict_mask(original_image, model, max_side=PREVIEW_MAX_SIDE, output_size=DISPLAY_SIZE,
+                                   cancelled=cancel_event.is_set)
+            post(cancel_event, display_images, original_image, decode_segmentation(preview))
+            post(cancel_event, set_status, "Vista previa lista; segmentando a resolución completa...")
+            if cancel_event.is_set():
+                return
+            mask = cached_predict_mask(original_image, model, model_fingerprint, digest, cancelled=cancel_event.is_set)
+        post(cancel_event, display_images, original_image, decode_segmentation(mask))
+        post(cancel_event, set_status, "Segmentación completa")
+    except SegmentationCancelled:
+        pass
+    except Exception as e:
+        post(cancel_event, show_error, f"Error al procesar la imagen: {e}")
+    finally:
+        post(cancel_event, finish_job, cancel_event)
+
+
+def finish_job(cancel_event):
+    if current_job["cancel"] is cancel_event:
+        current_job["cancel"] = None
+
+
+def cancel_segmentation():
+    if current_job["cancel"] is not None and not current_job["cancel"].is_set():
+        current_job["cancel"].set()
+        set_status("Segmentación cancelada")
+
+
 # Función para cargar y procesar la imagen seleccionada
-def select_image(model):
+def select_image(model_future):
     file_path = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg;*.jpeg;*.png")])
     if not file_path:
         return
 
-    try:
-        # Cargar la imagen
-        original_image = Image.open(file_path).convert("RGB")
-        segmented_image = segment_image(original_image, model)
-        
-        if segmented_image is not None:
-            # Mostrar las imágenes en la interfaz
-            display_images(original_image, segmented_image)
-    except Exception as e:
-        messagebox.showerror("Error", f"Error al procesar la imagen: {e}")
+    # Una nueva imagen cancela la anterior si aún se está segmentando
+    cancel_segmentation()
+    cancel_event = threading.Event()
+    current_job["cancel"] = cancel_event
+    set_status("Segmentando...")
+    segmentation_worker(segmentation_job, file_path, model_future, cancel_event)
 
 
 # Función para mostrar imágenes en la ventana
 def display_images(original, segmented):
     # Redimensionar imágenes para visualización
-    original_resized = original.resize((300, 300))
-    segmented_resized = segmented.resize((300, 300))
+    original_resized = original.resize(DISPLAY_SIZE)
+    segmented_resized = segmented.resize(DISPLAY_SIZE)
 
     # Convertir a formato compatible con Tkinter
     original_tk = ImageTk.PhotoImage(original_resized)
@@ -153,17 +216,24 @@ def main():
     if not check_dependencies():
         return
         
-    # Cargar el modelo
-    model = load_model()
-    if model is None:
-        return
+    # Cargar el modelo (desde la caché en disco si existe) sin bloquear la ventana
+    global segmentation_worker
+    segmentation_worker = background_worker()
+    model_loader = background_worker()
+    model_state = {"model": DEFAULT_MODEL, "backend": "torch"}
+
+    def reload_model(**selection):
+        model_state.update(selection)
+        model_state["future"] = model_loader(load_selected_model, model_state["model"], model_state["backend"])
+
+    reload_model()
     
     # Configuración de la ventana principal
-    global original_label, segmented_label
+    global original_label, segmented_label, status_label
     
     root = ctk.CTk()
     root.title("Segmentación Semántica")
-    root.geometry("750x650")
+    root.geometry("750x740")
     root.resizable(False, False)
     
     # Frame principal con padding
@@ -202,14 +272,45 @@ def main():
     select_button = ctk.CTkButton(
         main_frame, 
         text="Seleccionar Imagen", 
-        command=lambda: select_image(model), 
+        command=lambda: select_image(model_state["future"]), 
         font=ctk.CTkFont(size=16, weight="bold"),
         height=40,
         corner_radius=10,
         fg_color="#3498DB",
         hover_color="#2980B9"
     )
-    select_button.pack(pady=20)
+    select_button.pack(pady=(10, 5))
+
+    # Modelo: el cambio se carga en segundo plano; "Automático" elige según la latencia medida
+    options_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+    options_frame.pack(pady=(0, 10))
+    model_menu = ctk.CTkOptionMenu(
+        options_frame,
+        values=[AUTOMATIC_MODEL] + list(BACKBONES),
+        command=lambda option: reload_model(model=option),
+        width=260
+    )
+    model_menu.set(DEFAULT_MODEL)
+    model_menu.pack(side="left", padx=5)
+    backend_menu = ctk.CTkOptionMenu(
+        options_frame,
+        values=list(BACKEND_OPTIONS),
+        command=lambda option: reload_model(backend=BACKEND_OPTIONS[option]),
+        width=150
+    )
+    backend_menu.set("PyTorch")
+    backend_menu.pack(side="left", padx=5)
+    ctk.CTkButton(
+        options_frame,
+        text="Cancelar",
+        command=cancel_segmentation,
+        width=100,
+        fg_color="#E74C3C",
+        hover_color="#C0392B"
+    ).pack(side="left", padx=5)
+
+    status_label = ctk.CTkLabel(main_frame, text="", font=ctk.CTkFont(size=13))
+    status_label.pack()
 
     # Contenedores para mostrar las imágenes
     frame_images = ctk.CTkFrame(main_frame, corner_radius=15)
@@ -238,8 +339,14 @@ def main():
     )
     info_label.pack(pady=(0, 10))
 
+    process_ui_events(root)
     root.mainloop()
 
+    # Al cerrar la ventana no se espera a que termine una segmentación en curso: los hilos son
+    # daemon y el trabajo se marca como cancelado
+    if current_job["cancel"] is not None:
+        current_job["cancel"].set()
+
 
 if __name__ == "__main__":
     main()
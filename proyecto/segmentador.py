@@ -0,0 +1,460 @@
+import json
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from archivos import save_atomically
+from cacheResultados import ResultCache, fingerprint
+
+DEFAULT_MODEL = "deeplabv3_resnet101"
+MODEL_CACHE_DIR = os.environ.get(
+    "SEGMENTACION_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "segmentacion")
+)
+
+# Precisión publicada por torchvision (mIoU en COCO val2017 con las clases de VOC) y coste a 520 px
+BACKBONES = {
+    "deeplabv3_resnet101": {"miou": 67.4, "gflops": 258.74},
+    "fcn_resnet50": {"miou": 60.5, "gflops": 152.72},
+    "deeplabv3_mobilenet_v3_large": {"miou": 60.3, "gflops": 10.45},
+    "lraspp_mobilenet_v3_large": {"miou": 57.9, "gflops": 2.09},
+}
+PROFILE_SIZE = 520
+LATENCY_TABLE_PATH = os.path.join(MODEL_CACHE_DIR, "latencias.json")
+
+# Clases de PASCAL VOC que predicen los modelos de segmentación de torchvision
+CLASS_NAMES = (
+    "fondo", "avión", "bicicleta", "pájaro", "barco", "botella", "autobús", "coche", "gato", "silla", "vaca",
+    "mesa", "perro", "caballo", "moto", "persona", "planta", "oveja", "sofá", "tren", "monitor"
+)
+
+CLASS_COLORS = (
+    (0, 0, 0), (128, 0, 0), (0, 128, 0), (128, 128, 0),
+    (0, 0, 128), (128, 0, 128), (0, 128, 128), (128, 128, 128),
+    (64, 0, 0), (192, 0, 0), (64, 128, 0), (192, 128, 0),
+    (64, 0, 128), (192, 0, 128), (64, 128, 128), (192, 128, 128),
+    (0, 64, 0), (128, 64, 0), (0, 192, 0), (128, 192, 0),
+    (0, 64, 128)
+)
+
+
+# Tabla de 256 colores indexada por clase; las clases desconocidas quedan en negro
+@lru_cache(maxsize=None)
+def palette_lut(colors=CLASS_COLORS):
+    lut = np.zeros((256, 3), dtype=np.uint8)
+    lut[:len(colors)] = colors
+    lut.flags.writeable = False
+    return lut
+
+
+def as_class_mask(mask):
+    mask = np.asarray(mask)
+    if mask.dtype == np.uint8:
+        return mask
+    return np.where((mask >= 0) & (mask < 256), mask, 0).astype(np.uint8)
+
+
+def decode_segmentation(mask):
+    return Image.fromarray(palette_lut()[as_class_mask(mask)])
+
+
+# Mezcla la máscara de color sobre la imagen; el fondo conserva la imagen original
+def overlay_segmentation(image, mask, alpha=0.5, color_mask=None):
+    mask = as_class_mask(mask)
+    if color_mask is None:
+        color_mask = palette_lut()[mask]
+    blended = np.array(image.convert("RGB") if isinstance(image, Image.Image) else image, dtype=np.uint8)
+    if blended.shape[:2] != mask.shape:
+        raise ValueError("La imagen y la máscara deben tener el mismo tamaño")
+    foreground = mask != 0
+    mixed = blended[foreground] * (1 - alpha) + color_mask[foreground] * alpha
+    blended[foreground] = np.rint(mixed).astype(np.uint8)
+    return Image.fromarray(blended)
+
+
+# Píxeles y fracción del área por clase presente en la máscara
+def class_areas(mask):
+    mask = as_class_mask(mask)
+    counts = np.bincount(mask.ravel(), minlength=256)
+    total = mask.size
+    return {
+        CLASS_NAMES[class_idx] if class_idx < len(CLASS_NAMES) else f"clase {class_idx}": {
+            "pixels": int(counts[class_idx]),
+            "fraction": float(counts[class_idx] / total),
+        }
+        for class_idx in np.flatnonzero(counts)
+    }
+
+
+# Máscara de color, superposición y áreas por clase a partir de una sola indexación de la paleta
+def render_segmentation(mask, image=None, alpha=0.5):
+    mask = as_class_mask(mask)
+    color_mask = palette_lut()[mask]
+    return {
+        "mask": Image.fromarray(color_mask),
+        "overlay": None if image is None else overlay_segmentation(image, mask, alpha, color_mask),
+        "areas": class_areas(mask),
+    }
+
+
+def build_model(name=DEFAULT_MODEL):
+    if name not in BACKBONES:
+        raise ValueError(f"Modelo de segmentación no soportado: {name}")
+    from torchvision.models import segmentation
+    builder = getattr(segmentation, name)
+    try:
+        model = builder(weights="DEFAULT")
+    except TypeError:
+        # torchvision < 0.13 no acepta weights
+        model = builder(pretrained=True)
+    # La cabeza auxiliar solo sirve para entrenar y duplica el coste de la decodificación
+    if getattr(model, "aux_classifier", None) is not None:
+        model.aux_classifier = None
+    return model.eval()
+
+
+def cached_model_path(name=DEFAULT_MODEL, cache_dir=MODEL_CACHE_DIR):
+    import torch
+    version = torch.__version__.split("+")[0]
+    # "sinaux": modelos guardados sin la cabeza auxiliar de entrenamiento
+    return os.path.join(cache_dir, f"{name}-torch{version}-sinaux.pt")
+
+
+# Guarda el modelo como TorchScript: cargarlo después no importa torchvision ni reconstruye la red
+def export_model(model, path):
+    import torch
+    scripted = torch.jit.script(model)
+    save_atomically(path, lambda temp_path: torch.jit.save(scripted, temp_path))
+    return scripted
+
+
+# Carga sin memoizar: el modelo se libera en cuanto deja de usarse
+def read_model(name=DEFAULT_MODEL, cache_dir=MODEL_CACHE_DIR):
+    import torch
+    path = cached_model_path(name, cache_dir)
+    if os.path.exists(path):
+        try:
+            return torch.jit.load(path, map_location="cpu").eval()
+        except Exception as e:
+            print(f"Caché de modelo inválida en {path}, se regenera: {e}")
+
+    model = build_model(name)
+    try:
+        return export_model(model, path).eval()
+    except Exception as e:
+        print(f"No se pudo guardar el modelo en caché: {e}")
+        return model
+
+
+# Un modelo por proceso: las peticiones siguientes reutilizan el modelo ya cargado
+@lru_cache(maxsize=None)
+def load_model(name=DEFAULT_MODEL, cache_dir=MODEL_CACHE_DIR):
+    return read_model(name, cache_dir)
+
+
+BACKENDS = ("torch", "onnx")
+ONNX_OPSET = 17
+
+
+def onnx_model_path(name=DEFAULT_MODEL, cache_dir=MODEL_CACHE_DIR):
+    return os.path.join(cache_dir, f"{name}-opset{ONNX_OPSET}-sinaux.onnx")
+
+
+# Exportación única a ONNX con lote y tamaño de entrada dinámicos
+def export_onnx(name, path):
+    import torch
+    model = build_model(name)
+    example = torch.rand(1, 3, PROFILE_SIZE, PROFILE_SIZE)
+    axes = {0: "batch", 2: "height", 3: "width"}
+    save_atomically(path, lambda temp_path: torch.onnx.export(
+        model, example, temp_path, input_names=["input"], output_names=["out"],
+        dynamic_axes={"input": axes, "out": axes}, opset_version=ONNX_OPSET
+    ))
+
+
+# Sesión de onnxruntime en CPU con la misma interfaz que el modelo de PyTorch; tras la primera
+# exportación no importa torchvision
+@lru_cache(maxsize=None)
+def load_onnx_model(name=DEFAULT_MODEL, cache_dir=MODEL_CACHE_DIR):
+    import onnxruntime
+    import torch
+    path = onnx_model_path(name, cache_dir)
+    if not os.path.exists(path):
+        export_onnx(name, path)
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def run(batch):
+        (logits,) = session.run(["out"], {"input": np.ascontiguousarray(batch.numpy())})
+        return {"out": torch.from_numpy(logits)}
+    return run
+
+
+def load_backend(name=DEFAULT_MODEL, backend="torch"):
+    if backend not in BACKENDS:
+        raise ValueError(f"Motor de inferencia no soportado: {backend}")
+    return load_onnx_model(name) if backend == "onnx" else load_model(name)
+
+
+# Normalización de ImageNet precalculada: x / 255 normalizado == x * scale - offset
+IMAGE_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGE_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+NORMALIZE_SCALE = 1 / (255 * IMAGE_STD)
+NORMALIZE_OFFSET = IMAGE_MEAN / IMAGE_STD
+
+
+# (H, W, 3) uint8 -> (3, H, W) float32 normalizado
+def normalize_image(image):
+    normalized = np.asarray(image, dtype=np.float32) * NORMALIZE_SCALE
+    normalized -= NORMALIZE_OFFSET
+    return np.ascontiguousarray(normalized.transpose(2, 0, 1))
+
+
+def preprocess_image(image):
+    import torch
+    return torch.from_numpy(normalize_image(image)).unsqueeze(0)  # Agregar dimensión de batch
+
+
+INFERENCE_MODES = ("float32", "channels_last", "compile", "int8")
+
+
+def configure_threads(intra_op=None, inter_op=None):
+    import torch
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # Solo se puede fijar antes del primer trabajo paralelo del proceso
+            print("Los hilos entre operadores ya están en uso; se mantiene su número")
+
+
+# Pesos y entradas en NHWC, el formato que prefieren las convoluciones de CPU
+def channels_last_model(model):
+    import torch
+    model = model.to(memory_format=torch.channels_last)
+    return lambda batch: model(batch.contiguous(memory_format=torch.channels_last))
+
+
+# Cuantización int8 estática posentrenamiento (modo FX) calibrada con imágenes reales
+def quantize_model(model, calibration_images):
+    import torch
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+    if not calibration_images:
+        raise ValueError("La cuantización int8 necesita imágenes de calibración")
+    batches = [preprocess_image(image.resize((PROFILE_SIZE, PROFILE_SIZE))) for image in calibration_images]
+    qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+    prepared = prepare_fx(model, qconfig_mapping, (batches[0],))
+    with torch.inference_mode():
+        for batch in batches:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+# Modelo listo para un modo de inferencia; float32 es el modelo de la caché sin cambios
+def prepare_model(name=DEFAULT_MODEL, mode="float32", calibration_images=()):
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Modo de inferencia no soportado: {mode}")
+    if mode == "float32":
+        return load_model(name)
+    model = build_model(name)
+    if mode == "channels_last":
+        return channels_last_model(model)
+    if mode == "compile":
+        import torch
+        if not hasattr(torch, "compile"):
+            raise ValueError("torch.compile requiere PyTorch 2.0 o posterior")
+        return torch.compile(model)
+    return quantize_model(model, calibration_images)
+
+
+# Resolución de inferencia: lado mayor acotado y lado menor mínimo para imágenes pequeñas
+DEFAULT_MAX_SIDE = 1024
+DEFAULT_MIN_SIDE = 256
+# Solo se infiere por teselas solapadas cuando una pasada completa no cabe en el techo de memoria;
+# sin lado de tesela explícito se deriva del techo
+DEFAULT_TILE_SIZE = None
+DEFAULT_TILE_OVERLAP = 64
+DEFAULT_INFERENCE_MEMORY = 2 * 1024 ** 3
+# Estimación conservadora de la memoria de activaciones por píxel de entrada en los modelos del
+# registro (sin gradientes): con el techo por defecto una pasada admite unos 2 MP
+ACTIVATION_BYTES_PER_PIXEL = 1000
+
+
+def inference_size(width, height, max_side=DEFAULT_MAX_SIDE, min_side=DEFAULT_MIN_SIDE):
+    scale = min(1.0, max_side / max(width, height))
+    if min(width, height) * scale < min_side:
+        scale = min(min_side / min(width, height), max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+# Lado de la tesela cuadrada cuya pasada cabe en el techo de memoria; tile_side ** 2 es también el
+# máximo de píxeles que se infieren sin teselas
+def tile_side(tile_size=DEFAULT_TILE_SIZE, memory_budget=DEFAULT_INFERENCE_MEMORY):
+    if tile_size:
+        return tile_size
+    return max(64, int(np.sqrt(memory_budget / ACTIVATION_BYTES_PER_PIXEL)) // 8 * 8)
+
+
+def tile_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    # Teselas repartidas uniformemente con al menos `overlap` píxeles de solape
+    count = -(-(length - overlap) // max(1, tile - overlap))
+    return [int(start) for start in np.linspace(0, length - tile, count).round()]
+
+
+# Peso de mezcla: rampa lineal en la franja de solape para que las costuras no se noten
+def blend_window(h, w, overlap):
+    import torch
+    ramp_h = torch.minimum(torch.arange(1, h + 1), torch.arange(h, 0, -1)).clamp(max=overlap + 1)
+    ramp_w = torch.minimum(torch.arange(1, w + 1), torch.arange(w, 0, -1)).clamp(max=overlap + 1)
+    return (ramp_h[:, None] * ramp_w[None, :]).float()
+
+
+class SegmentationCancelled(Exception):
+    pass
+
+
+# `cancelled` se consulta entre teselas para abandonar una inferencia larga
+def tiled_logits(batch, model, tile=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP, cancelled=None):
+    import torch
+    _, _, h, w = batch.shape
+    if h * w <= tile * tile:
+        return model(batch)["out"][0]
+
+    logits_sum, weight_sum = None, torch.zeros(h, w)
+    for top in tile_starts(h, tile, overlap):
+        for left in tile_starts(w, tile, overlap):
+            if cancelled is not None and cancelled():
+                raise SegmentationCancelled()
+            crop = batch[:, :, top:top + tile, left:left + tile]
+            logits = model(crop)["out"][0]
+            window = blend_window(crop.shape[2], crop.shape[3], overlap)
+            if logits_sum is None:
+                logits_sum = torch.zeros(logits.shape[0], h, w)
+            logits_sum[:, top:top + tile, left:left + tile] += logits * window
+            weight_sum[top:top + tile, left:left + tile] += window
+    return logits_sum / weight_sum
+
+
+# Logits de un lote de imágenes del mismo tamaño: tantas por pasada como quepan en el techo de
+# memoria (tile ** 2 píxeles); las que no caben ni solas se infieren por teselas
+def batch_logits(batch, model, tile, overlap=DEFAULT_TILE_OVERLAP):
+    _, _, h, w = batch.shape
+    if h * w > tile * tile:
+        return [tiled_logits(item.unsqueeze(0), model, tile, overlap) for item in batch]
+    per_pass = max(1, tile * tile // (h * w))
+    return [logits for start in range(0, len(batch), per_pass) for logits in model(batch[start:start + per_pass])["out"]]
+
+
+def prepare_input(image, max_side=DEFAULT_MAX_SIDE):
+    size = inference_size(image.width, image.height, max_side)
+    resized = image if size == image.size else image.resize(size, Image.Resampling.BILINEAR)
+    return normalize_image(resized)
+
+
+# Logits (C, h, w) de la resolución de inferencia -> máscara de clases a la resolución original
+def logits_to_mask(logits, size, memory_budget=DEFAULT_INFERENCE_MEMORY):
+    import torch.nn.functional as F
+    width, height = size
+    if logits.shape[1:] == (height, width):
+        return logits.argmax(0).byte().cpu().numpy()
+    # Interpolar los logits da bordes más finos; si no caben en memoria se escala la máscara
+    if logits.shape[0] * width * height * 4 <= memory_budget // 2:
+        logits = F.interpolate(logits[None], size=(height, width), mode="bilinear", align_corners=False)[0]
+        return logits.argmax(0).byte().cpu().numpy()
+    mask = logits.argmax(0).byte().cpu().numpy()
+    return np.asarray(Image.fromarray(mask).resize((width, height), Image.Resampling.NEAREST))
+
+
+# Clase con mayor puntuación por píxel a la resolución original; todos los modelos del registro
+# devuelven la salida en "out"
+def predict_mask(image, model, max_side=DEFAULT_MAX_SIDE, tile_size=DEFAULT_TILE_SIZE,
+                 overlap=DEFAULT_TILE_OVERLAP, memory_budget=DEFAULT_INFERENCE_MEMORY, output_size=None,
+                 cancelled=None):
+    import torch
+    with torch.inference_mode():
+        batch = torch.from_numpy(prepare_input(image, max_side)).unsqueeze(0)
+        logits = tiled_logits(batch, model, tile_side(tile_size, memory_budget), overlap, cancelled)
+        return logits_to_mask(logits, output_size or image.size, memory_budget)
+
+
+# Primera llamada del modelo: torch.compile compila aquí, de forma perezosa, y no en prepare_model
+def warm_up(model, size=PROFILE_SIZE):
+    import torch
+    with torch.inference_mode():
+        model(torch.rand(1, 3, size, size))
+
+
+def measure_latency(model, size=PROFILE_SIZE, repeats=5, inference_mode=True):
+    import torch
+    batch = torch.rand(1, 3, size, size)
+    times = []
+    with torch.inference_mode() if inference_mode else torch.no_grad():
+        model(batch)  # Calentamiento
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(batch)
+            times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+# Mide la latencia de cada modelo en esta máquina y guarda la tabla junto a la caché de modelos.
+# Los modelos se cargan sin memoizar para no retenerlos todos en memoria después de medirlos
+def profile_backbones(names=tuple(BACKBONES), size=PROFILE_SIZE, repeats=5, path=LATENCY_TABLE_PATH):
+    table = load_latency_table(path)
+    for name in names:
+        table[name] = dict(BACKBONES[name], size=size, seconds=measure_latency(read_model(name), size, repeats))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(table, f, indent=2)
+    return table
+
+
+def load_latency_table(path=LATENCY_TABLE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+# El modelo más preciso cuya latencia medida cabe en el presupuesto (segundos por imagen a 520 px);
+# si ninguno cabe, el más rápido
+def choose_backbone(latency_budget, path=LATENCY_TABLE_PATH):
+    table = load_latency_table(path)
+    missing = [name for name in BACKBONES if name not in table]
+    if missing:
+        table = profile_backbones(missing, path=path)
+    fitting = [name for name in BACKBONES if table[name]["seconds"] <= latency_budget]
+    if not fitting:
+        return min(BACKBONES, key=lambda name: table[name]["seconds"])
+    return max(fitting, key=lambda name: BACKBONES[name]["miou"])
+
+
+segmentation_cache = ResultCache("segmentacion")
+
+
+def segmentation_fingerprint(name=DEFAULT_MODEL, backend="torch", mode="float32", max_side=DEFAULT_MAX_SIDE,
+                             tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP):
+    return fingerprint("segmentacion", name, backend, mode, max_side, tile_size, overlap)
+
+
+def cached_mask(model_fingerprint, digest):
+    cached = segmentation_cache.get(fingerprint(digest, model_fingerprint))
+    return None if cached is None else cached["mask"]
+
+
+# Máscara de la caché si el mismo contenido ya se segmentó con la misma configuración
+def cached_predict_mask(image, model, model_fingerprint, digest, cancelled=None):
+    mask = cached_mask(model_fingerprint, digest)
+    if mask is None:
+        mask = predict_mask(image, model, cancelled=cancelled)
+        segmentation_cache.put(fingerprint(digest, model_fingerprint), {"mask": mask})
+    return mask
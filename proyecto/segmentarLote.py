@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+from archivos import find_images, is_up_to_date, output_path_for, save_atomically
+from segmentador import (
+    BACKBONES, BACKENDS, DEFAULT_INFERENCE_MEMORY, DEFAULT_MAX_SIDE, DEFAULT_MODEL, DEFAULT_TILE_OVERLAP,
+    DEFAULT_TILE_SIZE, INFERENCE_MODES, batch_logits, configure_threads, inference_size, load_backend,
+    logits_to_mask, prepare_input, prepare_model, render_segmentation, tile_side
+)
+
+DEFAULT_LOADER_WORKERS = min(4, os.cpu_count() or 1)
+CALIBRATION_IMAGES = 8
+
+
+# Decodificación y preprocesado en los procesos del DataLoader
+class SegmentationDataset(Dataset):
+    def __init__(self, paths, max_side=DEFAULT_MAX_SIDE):
+        self.paths = paths
+        self.max_side = max_side
+
+    def __len__(self):
+        return len(self.paths)
+
+    # Un archivo que no se puede decodificar vuelve como error en lugar de cortar el lote
+    def __getitem__(self, index):
+        try:
+            with Image.open(self.paths[index]) as img:
+                image = img.convert("RGB")
+            return index, torch.from_numpy(prepare_input(image, self.max_side)), image.size
+        except Exception as e:
+            return index, None, str(e)
+
+
+# -> (índices, tensor apilado o None, tamaños originales, [(índice, error)])
+def collate(items):
+    loaded = [item for item in items if item[1] is not None]
+    failed = [(index, error) for index, tensor, error in items if tensor is None]
+    if not loaded:
+        return [], None, [], failed
+    indices, tensors, sizes = zip(*loaded)
+    return list(indices), torch.stack(tensors), list(sizes), failed
+
+
+# Lotes de imágenes con el mismo tamaño de inferencia, que se apilan en un solo tensor
+def size_grouped_batches(sizes, batch_size, max_side=DEFAULT_MAX_SIDE):
+    groups = defaultdict(list)
+    for index, size in enumerate(sizes):
+        groups[inference_size(size[0], size[1], max_side)].append(index)
+    return [
+        indices[start:start + batch_size]
+        for indices in groups.values()
+        for start in range(0, len(indices), batch_size)
+    ]
+
+
+# Registros de estadisticas.jsonl por archivo de salida: volver a segmentar reemplaza el registro
+def load_stats(path):
+    records = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record.get("output")] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def save_stats(path, records):
+    def write(temp_path):
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for record in records.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    save_atomically(path, write, suffix=".tmp")
+
+
+def segment_command(args):
+    if args.backend == "onnx" and args.mode != "float32":
+        print("--backend onnx solo se admite con --mode float32.", file=sys.stderr)
+        return 2
+    paths = find_images(args.inputs)
+    if not paths:
+        print("No se encontraron imágenes para segmentar.")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+    stats_path = os.path.join(args.output, "estadisticas.jsonl")
+    stats = load_stats(stats_path)
+
+    # Una máscara generada con otro modelo, motor o modo no está al día aunque sea más reciente
+    parameters = {"model": args.model, "backend": args.backend, "mode": args.mode, "max_side": args.max_side}
+    jobs, sizes = [], []
+    skipped = failures = 0
+    outputs = set()
+    for path in paths:
+        output_path = output_path_for(path, args.output, "png")
+        if output_path in outputs:
+            print(f"Advertencia: {path} se omite porque {output_path} ya corresponde a otra imagen", file=sys.stderr)
+            continue
+        outputs.add(output_path)
+        if not args.force and is_up_to_date(path, output_path, stats.get(output_path), parameters):
+            skipped += 1
+            continue
+        try:
+            # Solo lee la cabecera para agrupar por tamaño
+            with Image.open(path) as img:
+                sizes.append(img.size)
+        except Exception as e:
+            failures += 1
+            print(f"Error al procesar {path}: {e}", file=sys.stderr)
+            continue
+        jobs.append((path, output_path))
+
+    if not jobs:
+        print(f"\n0 imágenes segmentadas, {skipped} omitidas (actualizadas), {failures} con error.")
+        return 1 if failures else 0
+
+    loader = DataLoader(
+        SegmentationDataset([path for path, _ in jobs], args.max_side),
+        batch_sampler=size_grouped_batches(sizes, args.batch_size, args.max_side),
+        num_workers=args.workers,
+        collate_fn=collate
+    )
+
+    configure_threads(args.threads, args.interop_threads)
+    # int8 se calibra con las primeras imágenes que se pueden decodificar
+    calibration = []
+    if args.mode == "int8":
+        for path, _ in jobs:
+            if len(calibration) == CALIBRATION_IMAGES:
+                break
+            try:
+                with Image.open(path) as img:
+                    calibration.append(img.convert("RGB"))
+            except Exception:
+                continue
+    try:
+        if args.backend == "onnx":
+            model = load_backend(args.model, "onnx")
+        else:
+            model = prepare_model(args.model, args.mode, calibration)
+    except Exception as e:
+        print(f"Error al preparar el modelo {args.model} ({args.backend}, {args.mode}): {e}", file=sys.stderr)
+        return 1
+    tile = tile_side(args.tile_size, args.memory_budget)
+    segmented = 0
+    megapixels = 0.0
+    start = time.perf_counter()
+    try:
+        with torch.inference_mode():
+            for indices, batch, image_sizes, failed in loader:
+                for index, error in failed:
+                    failures += 1
+                    print(f"Error al procesar {jobs[index][0]}: {error}", file=sys.stderr)
+                if batch is None:
+                    continue
+                logits = batch_logits(batch, model, tile, args.overlap)
+                for index, item_logits, size in zip(indices, logits, image_sizes):
+                    path, output_path = jobs[index]
+                    try:
+                        rendered = render_segmentation(logits_to_mask(item_logits, size, args.memory_budget))
+                        rendered["mask"].save(output_path, "PNG")
+                    except Exception as e:
+                        failures += 1
+                        print(f"Error al procesar {path}: {e}", file=sys.stderr)
+                        continue
+                    stats[output_path] = {"input": path, "output": output_path, **parameters, "areas": rendered["areas"]}
+                    segmented += 1
+                    megapixels += size[0] * size[1] / 1e6
+                    print(f"{path} -> {output_path}")
+    finally:
+        save_stats(stats_path, stats)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"\n{segmented} imágenes segmentadas, {skipped} omitidas (actualizadas), {failures} con error. "
+        f"{megapixels:.2f} MP en {elapsed:.2f} s ({segmented / elapsed if elapsed else 0:.2f} imágenes/s)."
+    )
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segmentación semántica de imágenes por lotes, sin interfaz gráfica")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    segment = subparsers.add_parser("segment", help="Segmentar directorios o patrones glob de imágenes")
+    segment.add_argument("inputs", nargs="+", help="Directorios o patrones glob de entrada")
+    segment.add_argument("-o", "--output", required=True,
+                         help="Directorio de salida para las máscaras de color y estadisticas.jsonl")
+    segment.add_argument("-m", "--model", choices=list(BACKBONES), default=DEFAULT_MODEL)
+    segment.add_argument("--backend", choices=BACKENDS, default="torch",
+                         help="onnx ejecuta el modelo exportado (en caché) con onnxruntime")
+    segment.add_argument("--mode", choices=INFERENCE_MODES, default="float32",
+                         help="Optimización de inferencia en CPU; int8 se calibra con las primeras imágenes")
+    segment.add_argument("--threads", type=int, help="Hilos por operador de PyTorch")
+    segment.add_argument("--interop-threads", type=int, help="Hilos entre operadores de PyTorch")
+    segment.add_argument("-b", "--batch-size", type=int, default=4,
+                         help="Imágenes del mismo tamaño por lote; cada pasada agrupa las que caben en --memory-budget")
+    segment.add_argument("-w", "--workers", type=int, default=DEFAULT_LOADER_WORKERS,
+                         help="Procesos del DataLoader para decodificar y preprocesar")
+    segment.add_argument("--max-side", type=int, default=DEFAULT_MAX_SIDE, help="Lado mayor de inferencia")
+    segment.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE,
+                         help="Lado de las teselas; por defecto se deriva de --memory-budget")
+    segment.add_argument("--overlap", type=int, default=DEFAULT_TILE_OVERLAP)
+    segment.add_argument("--memory-budget", type=int, default=DEFAULT_INFERENCE_MEMORY,
+                         help="Techo de memoria de inferencia en bytes")
+    segment.add_argument("--force", action="store_true", help="Volver a segmentar aunque la salida esté actualizada")
+    segment.set_defaults(handler=segment_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())